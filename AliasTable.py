@@ -0,0 +1,56 @@
+import random
+import numpy as np
+from typing import List, Sequence, Tuple, Union
+
+
+# Walker's alias method (Vose's variant): built once in O(n) for n weighted entries,
+# after that every draw costs one uniform number, one gather and one comparison,
+# independent of n and of how skewed the weights are. Entry i is kept when the
+# fraction of the uniform draw is below probability[i], otherwise alias[i] is drawn.
+class AliasTable:
+
+    def __init__(self, weights: Sequence[float]) -> None:
+        values: np.ndarray = np.asarray(weights, dtype=np.float64)
+        if values.ndim != 1 or len(values) == 0:
+            raise ValueError("An alias table needs at least one weight")
+        if np.any(values < 0) or not np.all(np.isfinite(values)):
+            raise ValueError("Sampling weights must be finite and not negative")
+        if values.sum() == 0:
+            raise ValueError("At least one sampling weight must be positive")
+
+        self.probabilities: np.ndarray = values / values.sum()
+        self.probability, self.alias = self.__build(self.probabilities)
+
+    @staticmethod
+    def __build(probabilities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        size: int = len(probabilities)
+        scaled: np.ndarray = probabilities * size
+        probability: np.ndarray = np.ones(size, dtype=np.float64)
+        alias: np.ndarray = np.arange(size, dtype=np.int64)
+
+        small: List[int] = [index for index in range(size) if scaled[index] < 1.0]
+        large: List[int] = [index for index in range(size) if scaled[index] >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            probability[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+
+        # Whatever is left over is 1 up to rounding errors and keeps its own entry
+        return probability, alias
+
+    def __len__(self) -> int:
+        return len(self.probability)
+
+    def draw(self, rng: np.random.Generator, size: Union[int, Tuple[int, ...]], dtype: type = np.int64) -> np.ndarray:
+        scaled: np.ndarray = rng.random(size) * len(self.probability)
+        columns: np.ndarray = scaled.astype(np.int64)
+        np.minimum(columns, len(self.probability) - 1, out=columns)
+        return np.where(scaled - columns < self.probability.take(columns), columns, self.alias.take(columns)).astype(dtype, copy=False)
+
+    # One draw for the python reference engine
+    def sample(self, rng: random.Random) -> int:
+        scaled: float = rng.random() * len(self.probability)
+        column: int = min(int(scaled), len(self.probability) - 1)
+        return column if scaled - column < self.probability[column] else int(self.alias[column])
@@ -0,0 +1,137 @@
+import copy
+import math
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, TYPE_CHECKING
+
+import numpy as np
+
+from DailyThroughput import DailyThroughput
+from Histogram import Histogram
+from MonteCarloService import MonteCarloService, percentile_label
+from Profiler import PROFILER
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DEFAULT_STEP_DAYS: int = 7
+# Cutoffs are sent to the worker processes in about this many tasks per worker, so a
+# slow task at the end does not leave the other workers idle for long
+TASKS_PER_WORKER: int = 4
+
+
+# Scores how_many and when of a list of cutoffs. Top level, so it can run in a worker
+# process, the service arrives there as a copy with empty caches.
+def score_cutoffs(service: MonteCarloService, closed_items: DailyThroughput, cutoffs: Sequence[date], horizon_days: int,
+                  remaining_items: int) -> List[Dict]:
+    rows: List[Dict] = []
+
+    for cutoff in cutoffs:
+        target_date: date = cutoff + timedelta(horizon_days)
+        row: Dict = {"Cutoff": cutoff}
+
+        # Items closed after the cutoff up to the target date, None if the history ends before
+        closed_items_count: Optional[float] = closed_items.closed_between(cutoff, target_date)
+        how_many: Histogram = service.how_many_distribution(cutoff, target_date, closed_items)
+        row["How Many Actual"] = math.floor(closed_items_count) if closed_items_count is not None else None
+        for percentile, forecast in zip(service.percentiles, how_many.quantiles(service.percentiles, descending=True)):
+            row[f"How Many {percentile_label(percentile)}"] = forecast
+        row["How Many CRPS"] = how_many.crps(row["How Many Actual"]) if closed_items_count is not None else None
+
+        # The day the remaining items were closed, None if they were not closed before the history ends
+        days_to_close: Optional[int] = closed_items.days_to_close(cutoff, remaining_items)
+        when: Histogram = service.when_distribution(cutoff, remaining_items, closed_items)
+        row["When Actual"] = cutoff + timedelta(days_to_close) if days_to_close is not None else None
+        for percentile, forecast in zip(service.percentiles, when.quantiles(service.percentiles)):
+            row[f"When {percentile_label(percentile)}"] = service.sampling.date_after(cutoff, forecast)
+        row["When CRPS"] = when.crps(service.sampling.days_between(cutoff, row["When Actual"])) if days_to_close is not None else None
+
+        rows.append(row)
+
+    return rows
+
+
+# Replays the forecasts over the recorded history: at every cutoff how_many and when see
+# only the days up to the cutoff, the days after it are what actually happened. The
+# actuals come from the prefix sums of the one DailyThroughput, every cutoff reads its
+# window from the same array. A forecast is a hit when at least its percentile came true:
+# that many items or more were closed by the target date (how many), or the remaining
+# items were closed by the forecast date (when). A calibrated forecast hits about p of
+# the cutoffs at percentile p. CRPS scores the whole distribution against the actual
+# outcome, in items and simulated days, lower is better.
+class Backtest:
+
+    def __init__(self, service: MonteCarloService, closed_items: DailyThroughput, horizon_days: int, remaining_items: int,
+                 step_days: int = DEFAULT_STEP_DAYS) -> None:
+        if horizon_days <= 0:
+            raise ValueError("The backtest horizon must be at least one day")
+        if step_days <= 0:
+            raise ValueError("The backtest step must be at least one day")
+        if closed_items.first_day is None:
+            raise ValueError("The backtest needs a history with closed items")
+
+        self.service: MonteCarloService = service
+        self.closed_items: DailyThroughput = closed_items
+        self.horizon_days: int = horizon_days
+        self.remaining_items: int = remaining_items
+        self.step_days: int = step_days
+
+    # By default from the first day with a full history window to the last day whose
+    # horizon still ends inside the recorded history
+    def cutoffs(self, first_cutoff: Optional[date] = None, last_cutoff: Optional[date] = None) -> List[date]:
+        first_cutoff = first_cutoff or self.closed_items.first_day + timedelta(self.service.history_in_days - 1)
+        last_cutoff = last_cutoff or self.closed_items.last_day - timedelta(self.horizon_days)
+        if first_cutoff > last_cutoff:
+            raise ValueError(f"No backtest cutoff between {first_cutoff} and {last_cutoff}, the history is too short for the history window and horizon")
+
+        return [first_cutoff + timedelta(day) for day in range(0, (last_cutoff - first_cutoff).days + 1, self.step_days)]
+
+    # One row per cutoff. With more than one worker the cutoffs are spread over worker
+    # processes, each forecast uses the seed of the service, so the results do not
+    # depend on the number of workers.
+    def run(self, cutoffs: Sequence[date]) -> "pd.DataFrame":
+        import pandas as pd
+
+        workers: int = min(self.service.workers, len(cutoffs))
+        with PROFILER.stage("backtest") as stage:
+            if workers > 1:
+                rows: List[Dict] = self.__run_parallel(cutoffs, workers)
+            else:
+                rows = score_cutoffs(self.service, self.closed_items, cutoffs, self.horizon_days, self.remaining_items)
+            stage.add(cutoffs=len(cutoffs))
+
+        return pd.DataFrame.from_records(rows)
+
+    def __run_parallel(self, cutoffs: Sequence[date], workers: int) -> List[Dict]:
+        # The workers simulate one forecast after the other, the parallelism is across cutoffs
+        worker_service: MonteCarloService = copy.copy(self.service)
+        worker_service.workers = 1
+
+        tasks: List[np.ndarray] = [task for task in np.array_split(np.asarray(cutoffs, dtype=object), workers * TASKS_PER_WORKER) if len(task)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures: List[Future] = [executor.submit(score_cutoffs, worker_service, self.closed_items, list(task), self.horizon_days, self.remaining_items)
+                                     for task in tasks]
+            return [row for future in futures for row in future.result()]
+
+    # Share of the cutoffs that hit each percentile, and the mean CRPS, of the cutoffs whose outcome is known
+    def summary(self, results: "pd.DataFrame") -> "pd.DataFrame":
+        import pandas as pd
+
+        how_many: pd.DataFrame = results[results["How Many Actual"].notna()]
+        when: pd.DataFrame = results[results["When Actual"].notna()]
+        rows: List[Dict] = []
+
+        for percentile in self.service.percentiles:
+            label: str = percentile_label(percentile)
+            rows.append({
+                "Metric": f"Hit Rate {label}",
+                "How Many": (how_many["How Many Actual"] >= how_many[f"How Many {label}"]).mean() if len(how_many) else None,
+                "When": (when["When Actual"] <= when[f"When {label}"]).mean() if len(when) else None,
+            })
+        rows.append({
+            "Metric": "Mean CRPS",
+            "How Many": how_many["How Many CRPS"].mean() if len(how_many) else None,
+            "When": when["When CRPS"].mean() if len(when) else None,
+        })
+
+        return pd.DataFrame.from_records(rows)
@@ -0,0 +1,90 @@
+import json
+import sqlite3
+import zlib
+from datetime import datetime, timedelta
+
+
+# Local cache of issue changelogs, keyed by issue key and the issue's 'updated'
+# timestamp. An entry is valid as long as Jira reports the same 'updated' value,
+# so issues without a usable transition are not refetched on every sync.
+class ChangelogCache:
+    DEFAULT_PATH = "changelog_cache.sqlite"
+    # Entries that were not refreshed for this many days are evicted
+    DEFAULT_RETENTION_DAYS = 365
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS changelogs (
+                issue_key TEXT PRIMARY KEY,
+                updated TEXT,
+                histories BLOB,
+                start TEXT,
+                done TEXT,
+                fetched_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def clear(self):
+        self.connection.execute("DELETE FROM changelogs")
+        self.connection.execute("DELETE FROM sync_state")
+        self.connection.commit()
+
+    def get(self, issue_key, updated):
+        row = self.connection.execute("SELECT start, done FROM changelogs WHERE issue_key = ? AND updated IS ?",
+                                      (issue_key, updated)).fetchone()
+        if row is None:
+            return None
+        return tuple(datetime.fromisoformat(value) if value else None for value in row)
+
+    def getHistories(self, issue_key):
+        row = self.connection.execute("SELECT histories FROM changelogs WHERE issue_key = ?", (issue_key,)).fetchone()
+        if row is None:
+            return None
+        payload = json.loads(zlib.decompress(row[0]))
+        # Entries written before raw responses were stored only hold the histories
+        return payload if isinstance(payload, list) else payload['changelog']['histories']
+
+    # Stores the raw '?expand=changelog' response, so it never has to be re-serialized
+    def put(self, issue_key, updated, response, start, done):
+        payload = response.encode() if isinstance(response, str) else response
+        self.connection.execute("INSERT OR REPLACE INTO changelogs VALUES (?, ?, ?, ?, ?, ?)", (
+            issue_key,
+            updated,
+            zlib.compress(payload),
+            start.isoformat() if start else None,
+            done.isoformat() if done else None,
+            datetime.now().isoformat()
+        ))
+
+    # High-water mark of the last successful sync, the next sync only needs issues updated since then
+    def getWatermark(self):
+        row = self.connection.execute("SELECT value FROM sync_state WHERE name = 'last_sync'").fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def setWatermark(self, last_sync):
+        self.connection.execute("INSERT OR REPLACE INTO sync_state VALUES ('last_sync', ?)", (last_sync.isoformat(),))
+        self.connection.commit()
+
+    def evict(self, retention_days=DEFAULT_RETENTION_DAYS):
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        removed = self.connection.execute("DELETE FROM changelogs WHERE fetched_at < ?", (cutoff,)).rowcount
+        self.connection.commit()
+        if removed > 0:
+            self.connection.execute("VACUUM")
+        return removed
@@ -0,0 +1,110 @@
+import csv
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from Profiler import PROFILER
+
+# A percentile marker: position on the x axis, label, color and, for 'when', the predicted date
+PercentileLine = Tuple[int, str, str, Optional[date]]
+
+
+# Renders the simulation results off the hot path. The service hands over the computed
+# histogram and percentiles, rendering and writing happens on a background thread.
+# Figures are created with the non-interactive Agg canvas and never touch the global
+# pyplot state, so nothing blocks in headless runs and no figure outlives its write.
+# "json" and "csv" skip matplotlib completely and only write the histogram data.
+class ChartRenderer:
+
+    FORMATS: Tuple[str, ...] = ("png", "json", "csv")
+
+    def __init__(self, charts_folder: str, output_format: str = "png", workers: int = 1) -> None:
+        if output_format not in self.FORMATS:
+            raise ValueError(f"Unknown chart format '{output_format}', expected one of {', '.join(self.FORMATS)}")
+
+        self.charts_folder: str = charts_folder
+        self.output_format: str = output_format
+        # A single worker keeps matplotlib, which is not thread safe, on one thread
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="charts")
+        self.pending: List[Future] = []
+
+        os.makedirs(charts_folder, exist_ok=True)
+
+    def render_when(self, histogram: Dict, percentile_lines: List[PercentileLine], title: str) -> Future:
+        return self.__submit('MC_When', histogram, percentile_lines, title, 'g')
+
+    def render_how_many(self, histogram: Dict, percentile_lines: List[PercentileLine], title: str) -> Future:
+        return self.__submit('MC_HowMany', histogram, percentile_lines, title, 'g')
+
+    def render_throughput(self, histogram: Dict, title: str = "") -> Future:
+        return self.__submit('Throughput_Run_Chart', histogram, [], title, 'b')
+
+    # Waits for all charts that were submitted so far and raises the first failure
+    def wait(self) -> None:
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+
+    def close(self) -> None:
+        self.wait()
+        self.executor.shutdown()
+
+    def __submit(self, name: str, histogram: Dict, percentile_lines: List[PercentileLine], title: str, color: str) -> Future:
+        path: str = os.path.join(self.charts_folder, f"{name}.{self.output_format}")
+        print(f"Storing Chart at {path}")
+
+        # Copy, the caller may keep using its dict while the chart is written
+        data: Dict = dict(sorted(histogram.items()))
+        future: Future = self.executor.submit(self.__write, path, data, list(percentile_lines), title, color)
+        self.pending.append(future)
+        return future
+
+    def __write(self, path: str, histogram: Dict, percentile_lines: List[PercentileLine], title: str, color: str) -> None:
+        with PROFILER.stage(f"charts.write.{self.output_format}"):
+            if self.output_format == "json":
+                self.__write_json(path, histogram, percentile_lines, title)
+            elif self.output_format == "csv":
+                self.__write_csv(path, histogram)
+            else:
+                self.__write_png(path, histogram, percentile_lines, title, color)
+
+    def __write_png(self, path: str, histogram: Dict, percentile_lines: List[PercentileLine], title: str, color: str) -> None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        figure: Figure = Figure(figsize=(15, 9))
+        FigureCanvasAgg(figure)
+        axes = figure.subplots()
+        axes.bar(list(histogram.keys()), list(histogram.values()), color=color)
+
+        for position, line_name, line_color, ddate in percentile_lines:
+            label: str = f"{line_name} ({position} days) -> {ddate}" if ddate is not None else f"{line_name} ({position})"
+            axes.axvline(x=position, color=line_color, linestyle='--', label=label)
+
+        if percentile_lines:
+            axes.legend()
+        axes.set_title(title)
+
+        figure.savefig(path)
+        figure.clear()
+
+    def __write_json(self, path: str, histogram: Dict, percentile_lines: List[PercentileLine], title: str) -> None:
+        with open(path, 'w') as file:
+            json.dump({
+                "title": title,
+                "histogram": [{"value": self.__plain(key), "count": self.__plain(count)} for key, count in histogram.items()],
+                "percentiles": [{"label": line_name, "value": self.__plain(position), "date": ddate.isoformat() if ddate is not None else None}
+                                for position, line_name, _, ddate in percentile_lines]
+            }, file, indent=2)
+
+    def __write_csv(self, path: str, histogram: Dict) -> None:
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file, delimiter=';')
+            writer.writerow(["Value", "Count"])
+            writer.writerows((self.__plain(key), self.__plain(count)) for key, count in histogram.items())
+
+    @staticmethod
+    def __plain(value):
+        return value.item() if hasattr(value, "item") else value
@@ -0,0 +1,133 @@
+import csv
+import numpy as np
+from datetime import date, datetime, timedelta
+from typing import List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class DailyThroughput:
+
+    def __init__(self, closed_items_hist: Optional["pd.DataFrame"] = None, date_column: str = 'Done Date', items_column: str = 'Items',
+                 date_format: str = "%Y-%m-%d") -> None:
+        self.first_day: Optional[date] = None
+        self.throughput: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.record_count: int = 0
+        self.__cumulative: Optional[np.ndarray] = None
+
+        if closed_items_hist is not None:
+            import pandas as pd
+
+            done_dates: np.ndarray = pd.to_datetime(closed_items_hist[date_column], format=date_format, errors='coerce').to_numpy(dtype='datetime64[D]')
+            self.__build(done_dates, closed_items_hist[items_column].to_numpy(dtype=float))
+
+    # Reads a simple date/items csv with the csv module and NumPy only, without pandas
+    @classmethod
+    def from_csv(cls, file_name: str, delimiter: str = ";", date_column: str = 'Done Date', items_column: str = 'Items',
+                 date_format: str = "%Y-%m-%d") -> "DailyThroughput":
+        dates: List[str] = []
+        items: List[float] = []
+
+        with open(file_name, newline='') as file:
+            reader = csv.DictReader(file, delimiter=delimiter)
+            missing: List[str] = [column for column in (date_column, items_column) if column not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"Columns {', '.join(missing)} not found in {file_name}")
+
+            for row in reader:
+                dates.append(row[date_column])
+                items.append(float(row[items_column]) if row[items_column] else 0.0)
+
+        daily_throughput: DailyThroughput = cls()
+        daily_throughput.__build(cls.__parse_dates(dates, date_format), np.asarray(items, dtype=float))
+        return daily_throughput
+
+    @staticmethod
+    def __parse_dates(dates: List[str], date_format: str) -> np.ndarray:
+        if date_format == "%Y-%m-%d":
+            try:
+                return np.asarray(dates, dtype='datetime64[D]')
+            except ValueError:
+                pass
+
+        parsed: List[np.datetime64] = []
+        for value in dates:
+            try:
+                parsed.append(np.datetime64(datetime.strptime(value, date_format).date(), 'D'))
+            except ValueError:
+                parsed.append(np.datetime64('NaT', 'D'))
+        return np.asarray(parsed, dtype='datetime64[D]')
+
+    # Sums the items per day into a dense array from the first to the last done day
+    def __build(self, done_dates: np.ndarray, items: np.ndarray) -> None:
+        valid: np.ndarray = ~np.isnat(done_dates)
+        done_dates, items = done_dates[valid], np.nan_to_num(items[valid])
+        self.record_count = len(done_dates)
+
+        if self.record_count == 0:
+            return
+
+        first_day: np.datetime64 = done_dates.min()
+        values: np.ndarray = np.bincount((done_dates - first_day).astype(np.int64), weights=items)
+        self.first_day = first_day.astype(date)
+        self.throughput = values.astype(np.int64) if np.all(np.mod(values, 1) == 0) else values
+        self.__cumulative = None
+
+    @property
+    def last_day(self) -> Optional[date]:
+        return self.first_day + timedelta(days=len(self.throughput) - 1) if self.first_day else None
+
+    def day_offset(self, day: date) -> int:
+        return (day - self.first_day).days if self.first_day else 0
+
+    # Throughput of the history_in_days days up to and including start_date, oldest
+    # first. Days without closed items, also outside of the recorded range, are 0.
+    def window(self, start_date: date, history_in_days: int) -> np.ndarray:
+        window: np.ndarray = np.zeros(history_in_days, dtype=self.throughput.dtype)
+
+        if self.first_day is None or history_in_days <= 0:
+            return window
+
+        end: int = self.day_offset(start_date) + 1
+        begin: int = end - history_in_days
+        source_begin: int = max(begin, 0)
+        source_end: int = min(end, len(self.throughput))
+
+        if source_begin < source_end:
+            window[source_begin - begin:source_end - begin] = self.throughput[source_begin:source_end]
+
+        return window
+
+    # Prefix sums, cumulative[i] is the throughput of the first i recorded days
+    @property
+    def cumulative(self) -> np.ndarray:
+        if self.__cumulative is None:
+            self.__cumulative = np.concatenate(([0], np.cumsum(self.throughput)))
+        return self.__cumulative
+
+    # Items closed after start_date up to and including end_date, None if end_date is
+    # after the last recorded day
+    def closed_between(self, start_date: date, end_date: date) -> Optional[float]:
+        if self.first_day is None or end_date > self.last_day:
+            return None
+
+        cumulative: np.ndarray = self.cumulative
+        begin: int = min(max(self.day_offset(start_date) + 1, 0), len(self.throughput))
+        end: int = max(self.day_offset(end_date) + 1, 0)
+        return (cumulative[end] - cumulative[begin]).item() if end > begin else 0
+
+    # Days after start_date until items are closed, None if the recorded history ends before
+    def days_to_close(self, start_date: date, items: float) -> Optional[int]:
+        if items <= 0:
+            return 0
+        if self.first_day is None:
+            return None
+
+        cumulative: np.ndarray = self.cumulative
+        begin: int = min(max(self.day_offset(start_date) + 1, 0), len(self.throughput))
+        # First recorded day whose prefix sum reaches the items closed before start_date plus items
+        end: int = int(np.searchsorted(cumulative, cumulative[begin] + items, side='left'))
+        if end >= len(cumulative):
+            return None
+        return end - 1 - self.day_offset(start_date)
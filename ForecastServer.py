@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import threading
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from DailyThroughput import DailyThroughput
+from MonteCarloService import MonteCarloService, percentile_label
+from Profiler import PROFILER
+
+DEFAULT_HOST: str = "127.0.0.1"
+DEFAULT_PORT: int = 8642
+DEFAULT_CACHE_SIZE: int = 1024
+# Services (one per history window) kept warm, the least recently used one is dropped beyond it
+DEFAULT_MAX_SERVICES: int = 32
+
+
+# Keeps the daily throughput resident and reloads it only when the file changes. It is
+# read with the csv module and NumPy and prepared once per version, all services and
+# requests share it. The version (modification time and size) is part of every result
+# cache key.
+class HistoryDataset:
+
+    def __init__(self, file_name: str, delimeter: str = ";", closed_date_column: str = "Done Date", items_column: str = "Points") -> None:
+        self.file_name: str = file_name
+        self.delimeter: str = delimeter
+        self.closed_date_column: str = closed_date_column
+        self.items_column: str = items_column
+        self.version: Optional[Tuple[int, int]] = None
+        self.history: Optional[DailyThroughput] = None
+        self.lock: threading.Lock = threading.Lock()
+
+    def get(self) -> Tuple[Tuple[int, int], DailyThroughput]:
+        stat: os.stat_result = os.stat(self.file_name)
+        version: Tuple[int, int] = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            if version != self.version:
+                self.history = DailyThroughput.from_csv(self.file_name, self.delimeter, self.closed_date_column, self.items_column)
+                self.version = version
+            return self.version, self.history
+
+
+# Runs forecasts for a long-lived process: identical results are served from an LRU
+# cache and identical requests that are still running are coalesced, the later
+# callers wait for the result of the first one instead of simulating again.
+class ForecastServer:
+
+    def __init__(self, dataset: HistoryDataset, cache_size: int = DEFAULT_CACHE_SIZE, engine: str = "numpy", workers: int = 1,
+                 max_services: int = DEFAULT_MAX_SERVICES) -> None:
+        self.dataset: HistoryDataset = dataset
+        self.cache_size: int = cache_size
+        self.engine: str = engine
+        self.workers: int = workers if workers > 0 else (os.cpu_count() or 1)
+        self.max_services: int = max_services
+        # All services share one process pool, so a dropped service leaves nothing running
+        self.executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+        self.lock: threading.Lock = threading.Lock()
+        self.results: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self.in_flight: Dict[Tuple, Future] = {}
+        # One service per history keeps its throughput windows and sampling tables warm,
+        # every request runs on a variant of it with its own trials and seed. Their caches
+        # hold on to the history they prepared, so all services are dropped when the
+        # history file changes.
+        self.services: "OrderedDict[int, MonteCarloService]" = OrderedDict()
+        self.services_version: Optional[Tuple[int, int]] = None
+        self.stats: Dict[str, int] = {"requests": 0, "cache_hits": 0, "coalesced": 0, "simulations": 0}
+
+    def forecast(self, start_date: date, target_date: date, remaining_items: int, history: int,
+                 trials: int = 100000, seed: Optional[int] = None) -> Dict:
+        version, closed_items_history = self.dataset.get()
+        key: Tuple = (version, start_date, target_date, remaining_items, history, trials, seed)
+
+        with self.lock:
+            self.stats["requests"] += 1
+            if key in self.results:
+                self.stats["cache_hits"] += 1
+                self.results.move_to_end(key)
+                return self.results[key]
+
+            future: Optional[Future] = self.in_flight.get(key)
+            owner: bool = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+            else:
+                self.stats["coalesced"] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            with PROFILER.stage("server.forecast"):
+                result: Dict = self.__simulate(version, closed_items_history, start_date, target_date, remaining_items, history, trials, seed)
+        except BaseException as error:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(error)
+            raise
+
+        with self.lock:
+            self.stats["simulations"] += 1
+            self.results[key] = result
+            if len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+            del self.in_flight[key]
+        future.set_result(result)
+        return result
+
+    # Server counters together with the stage and request counters of the profiler,
+    # the latter stay empty unless the profiler is enabled (--Profile)
+    def metrics(self) -> Dict:
+        return {"stats": self.get_stats(), "profiling": PROFILER.enabled, **PROFILER.snapshot()}
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
+
+    # Stops the shared worker processes, call it before the process exits
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __get_service(self, version: Tuple[int, int], history: int) -> MonteCarloService:
+        with self.lock:
+            if version != self.services_version:
+                self.services.clear()
+                self.services_version = version
+
+            if history not in self.services:
+                self.services[history] = MonteCarloService(history, False, engine=self.engine, workers=self.workers, executor=self.executor)
+                if len(self.services) > self.max_services:
+                    self.services.popitem(last=False)
+            self.services.move_to_end(history)
+            return self.services[history]
+
+    def __simulate(self, version: Tuple[int, int], closed_items_history: DailyThroughput, start_date: date, target_date: date, remaining_items: int,
+                   history: int, trials: int, seed: Optional[int]) -> Dict:
+        service: MonteCarloService = self.__get_service(version, history).variant(trials, seed)
+        percentile_labels = [percentile_label(percentile) for percentile in service.percentiles]
+
+        how_many: Tuple = service.how_many(start_date, target_date, closed_items_history)
+        result: Dict = {
+            "start_date": start_date.isoformat(),
+            "target_date": target_date.isoformat(),
+            "history": history,
+            "trials": trials,
+            "seed": seed,
+            "how_many": {label: int(value) for label, value in zip(percentile_labels, how_many)}
+        }
+
+        if remaining_items > 0:
+            when: Tuple = service.when(remaining_items, closed_items_history, start_date, target_date)
+            result["remaining_items"] = remaining_items
+            result["when"] = {label: value.isoformat() for label, value in zip(percentile_labels, when[:-1])}
+            result["target_date_likelihood"] = when[-1]
+
+        return result
+
+
+class ForecastRequestHandler(BaseHTTPRequestHandler):
+    forecast_server: ForecastServer
+    date_format: str = "%d.%m.%Y"
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlparse(self.path)
+        if url.path == "/stats":
+            self.__respond(200, self.forecast_server.get_stats())
+            return
+        if url.path == "/metrics":
+            self.__respond(200, self.forecast_server.metrics())
+            return
+        if url.path != "/forecast":
+            self.__respond(404, {"error": f"Unknown path {url.path}"})
+            return
+
+        params: Dict[str, str] = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+        try:
+            start_date: date = datetime.strptime(params["StartDate"], self.date_format).date()
+            target_date: date = datetime.strptime(params["TargetDate"], self.date_format).date()
+            remaining_items: int = int(params.get("RemainingItems", "0"))
+            history: int = int(params.get("History", "60"))
+            trials: int = int(params.get("Trials", "100000"))
+            seed: Optional[int] = int(params["Seed"]) if "Seed" in params else None
+            if history <= 0 or trials <= 0:
+                raise ValueError("History and Trials must be at least 1")
+        except (KeyError, ValueError) as error:
+            self.__respond(400, {"error": f"Invalid parameters: {error}"})
+            return
+
+        # Every failure gets an answer, the callers coalesced on this forecast get the same error
+        try:
+            self.__respond(200, self.forecast_server.forecast(start_date, target_date, remaining_items, history, trials, seed))
+        except ValueError as error:
+            self.__respond(422, {"error": str(error)})
+        except Exception as error:
+            self.__respond(500, {"error": f"Forecast failed: {type(error).__name__}: {error}"})
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def __respond(self, status: int, body: Dict) -> None:
+        payload: bytes = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def create_http_server(forecast_server: ForecastServer, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                       date_format: str = "%d.%m.%Y") -> ThreadingHTTPServer:
+    handler = type("BoundForecastRequestHandler", (ForecastRequestHandler,), {"forecast_server": forecast_server, "date_format": date_format})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+# Minimal local client, dates are passed in the server's date format (default %d.%m.%Y)
+def request_forecast(start_date: str, target_date: str, remaining_items: int = 0, history: int = 60, trials: int = 100000,
+                     seed: Optional[int] = None, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> Dict:
+    params: Dict[str, object] = {"StartDate": start_date, "TargetDate": target_date, "RemainingItems": remaining_items,
+                                 "History": history, "Trials": trials}
+    if seed is not None:
+        params["Seed"] = seed
+
+    with urllib.request.urlopen(f"http://{host}:{port}/forecast?{urllib.parse.urlencode(params)}") as response:
+        return json.loads(response.read())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--FileName", default='issue_throughput_60d.csv')
+    parser.add_argument("--Delimeter", default=";")
+    parser.add_argument("--ClosedDateColumn", default="Done Date")
+    parser.add_argument("--ItemsColumn", default="Points")
+    parser.add_argument("--TargetDateFormat", default="%d.%m.%Y")
+    parser.add_argument("--Engine", default="numpy", choices=MonteCarloService.ENGINES)
+    parser.add_argument("--Workers", default="1")
+    parser.add_argument("--Host", default=DEFAULT_HOST)
+    parser.add_argument("--Port", default=str(DEFAULT_PORT))
+    parser.add_argument("--CacheSize", default=str(DEFAULT_CACHE_SIZE))
+    parser.add_argument("--MaxServices", default=str(DEFAULT_MAX_SERVICES))
+    parser.add_argument("--Profile", default=False, action=argparse.BooleanOptionalAction)
+    args = parser.parse_args()
+
+    if args.Profile:
+        PROFILER.enable()
+
+    dataset = HistoryDataset(args.FileName, args.Delimeter, args.ClosedDateColumn, args.ItemsColumn)
+    forecast_server = ForecastServer(dataset, int(args.CacheSize), args.Engine, int(args.Workers), int(args.MaxServices))
+    http_server = create_http_server(forecast_server, args.Host, int(args.Port), args.TargetDateFormat)
+
+    print(f"Serving forecasts for {args.FileName} on http://{args.Host}:{args.Port}/forecast")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        forecast_server.close()
+
+
+if __name__ == "__main__":
+    main()
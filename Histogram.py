@@ -0,0 +1,177 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Union
+
+
+# Outcomes of a simulation: counts[i] trials ended with offset + i items (how many) or
+# days (when). Sampled results count trials as int64, the exact engine stores expected
+# counts as float64. The buffer grows with headroom, so increment is O(1) amortized,
+# and results of different shards merge with one vectorized add. The trimmed view and
+# its cumulative distribution are computed once and cached until the next change.
+class Histogram:
+
+    def __init__(self, counts: Optional[Sequence] = None, offset: int = 0) -> None:
+        values: np.ndarray = np.asarray(counts if counts is not None else [], dtype=None if counts is not None else np.int64)
+        self.__buffer: np.ndarray = values.astype(np.int64 if values.dtype.kind in "iub" else np.float64).ravel()
+        self.__offset: int = offset
+        self.__cache: Optional[tuple] = None
+
+    @classmethod
+    def from_dict(cls, counts: Dict[int, Union[int, float]]) -> "Histogram":
+        if not counts:
+            return cls()
+        offset: int = min(counts)
+        values: np.ndarray = np.zeros(max(counts) - offset + 1, dtype=np.float64 if any(isinstance(count, float) for count in counts.values()) else np.int64)
+        values[np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)) - offset] = list(counts.values())
+        return cls(values, offset)
+
+    @classmethod
+    def from_values(cls, values: Sequence[int]) -> "Histogram":
+        outcomes: np.ndarray = np.asarray(values, dtype=np.int64)
+        if outcomes.size == 0:
+            return cls()
+        offset: int = int(outcomes.min())
+        return cls(np.bincount(outcomes - offset), offset)
+
+    def copy(self) -> "Histogram":
+        return Histogram(self.counts.copy(), self.offset)
+
+    # Makes room for value, with as much headroom as the buffer already has
+    def __grow(self, low: int, high: int) -> None:
+        size: int = len(self.__buffer)
+        if size == 0:
+            self.__buffer = np.zeros(max(high - low, 1), dtype=self.__buffer.dtype)
+            self.__offset = low
+            return
+
+        headroom: int = max(size, 16)
+        new_offset: int = low - headroom if low < self.__offset else self.__offset
+        new_end: int = high + headroom if high > self.__offset + size else self.__offset + size
+        buffer: np.ndarray = np.zeros(new_end - new_offset, dtype=self.__buffer.dtype)
+        buffer[self.__offset - new_offset:self.__offset - new_offset + size] = self.__buffer
+        self.__buffer, self.__offset = buffer, new_offset
+
+    def increment(self, value: int, count: int = 1) -> None:
+        index: int = value - self.__offset
+        if index < 0 or index >= len(self.__buffer):
+            self.__grow(value, value + 1)
+            index = value - self.__offset
+        self.__buffer[index] += count
+        self.__cache = None
+
+    def merge(self, other: Union["Histogram", np.ndarray]) -> "Histogram":
+        if not isinstance(other, Histogram):
+            other = Histogram(other)
+        counts: np.ndarray = other.counts
+        if len(counts) == 0:
+            return self
+
+        if counts.dtype.kind == "f" and self.__buffer.dtype.kind != "f":
+            self.__buffer = self.__buffer.astype(np.float64)
+        low: int = other.offset
+        if low < self.__offset or low + len(counts) > self.__offset + len(self.__buffer) or len(self.__buffer) == 0:
+            self.__grow(low, low + len(counts))
+
+        start: int = low - self.__offset
+        self.__buffer[start:start + len(counts)] += counts
+        self.__cache = None
+        return self
+
+    def __add__(self, other: "Histogram") -> "Histogram":
+        return self.copy().merge(other)
+
+    # (offset, counts, cumulative, survival) of the part between the lowest and the
+    # highest outcome that occurred, survival[i] is the count of outcomes >= offset + i
+    def __compact(self) -> tuple:
+        if self.__cache is None:
+            occupied: np.ndarray = np.flatnonzero(self.__buffer)
+            if len(occupied) == 0:
+                counts: np.ndarray = self.__buffer[:0]
+                offset: int = self.__offset
+            else:
+                counts = self.__buffer[occupied[0]:occupied[-1] + 1]
+                offset = self.__offset + int(occupied[0])
+            cumulative: np.ndarray = np.cumsum(counts)
+            total = cumulative[-1] if len(cumulative) else counts.dtype.type(0)
+            survival: np.ndarray = total - cumulative + counts
+            self.__cache = (offset, counts, cumulative, survival)
+        return self.__cache
+
+    @property
+    def offset(self) -> int:
+        return self.__compact()[0]
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self.__compact()[1]
+
+    @property
+    def cdf(self) -> np.ndarray:
+        return self.__compact()[2]
+
+    @property
+    def values(self) -> np.ndarray:
+        offset, counts = self.__compact()[:2]
+        return np.arange(offset, offset + len(counts))
+
+    @property
+    def total(self) -> Union[int, float]:
+        cumulative: np.ndarray = self.cdf
+        return cumulative[-1].item() if len(cumulative) else 0
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.counts))
+
+    def __bool__(self) -> bool:
+        return self.total > 0
+
+    # Ascending: the smallest outcome that at least p of the trials reach or undercut
+    # (when: p of the trials are done by that day). Descending: the largest outcome
+    # that at least p of the trials reach or exceed (how many: done in p of the trials).
+    def quantiles(self, percentiles: Sequence[float], descending: bool = False) -> List[int]:
+        offset, counts, cumulative, survival = self.__compact()
+        if len(counts) == 0:
+            raise ValueError("Cannot compute percentiles of an empty histogram")
+
+        targets: np.ndarray = np.asarray(percentiles, dtype=float) * cumulative[-1]
+        if descending:
+            # survival is non-increasing, count the outcomes that still reach the target
+            indices: np.ndarray = np.searchsorted(-survival, -targets, side='right') - 1
+        else:
+            indices = np.searchsorted(cumulative, targets, side='left')
+        return [offset + int(index) for index in np.clip(indices, 0, len(counts) - 1)]
+
+    def probability_at_most(self, value: int) -> float:
+        offset, counts, cumulative, _ = self.__compact()
+        if len(counts) == 0 or value < offset:
+            return 0.0
+        return float(cumulative[min(value - offset, len(counts) - 1)] / cumulative[-1])
+
+    def probability_at_least(self, value: int) -> float:
+        offset, counts, cumulative, survival = self.__compact()
+        if len(counts) == 0 or value >= offset + len(counts):
+            return 0.0
+        return float(survival[max(value - offset, 0)] / cumulative[-1])
+
+    # Continuous ranked probability score of the observed outcome, in outcome units: the
+    # sum over all integers x of (P(outcome <= x) - [x >= observed])^2. 0 for a certain,
+    # correct forecast, it grows with both the miss and the spread.
+    def crps(self, observed: float) -> float:
+        offset, counts, cumulative, _ = self.__compact()
+        if len(counts) == 0:
+            raise ValueError("Cannot score an empty histogram")
+
+        outcomes: np.ndarray = np.arange(offset, offset + len(counts))
+        score: float = float(np.sum((cumulative / cumulative[-1] - (outcomes >= observed)) ** 2))
+        # Below the lowest outcome the distribution is 0, above the highest one it is 1
+        below: int = max(offset - int(np.ceil(observed)), 0)
+        above: int = max(int(np.ceil(observed)) - (offset + len(counts)), 0)
+        return score + below + above
+
+    def mean(self) -> float:
+        return float(np.dot(self.values, self.counts) / self.total) if self else 0.0
+
+    # Only the outcomes that occurred, e.g. for the chart renderer
+    def to_dict(self) -> Dict[int, Union[int, float]]:
+        offset, counts = self.__compact()[:2]
+        occupied: np.ndarray = np.flatnonzero(counts)
+        return {int(index) + offset: counts[index].item() for index in occupied}
@@ -0,0 +1,121 @@
+import os
+import time
+import uuid
+from datetime import date
+from typing import Dict, List, Optional, Set
+
+import pandas as pd
+
+
+# Append-only, columnar store of closed issues. Every append writes one Parquet file
+# per Done month into a hive style partition (done_month=YYYY-MM), so readers can
+# skip whole months and only load the columns they need. Every row carries a write
+# sequence that grows with every append, an issue appended again replaces the row
+# written before, also when its Done month changed. Needs pyarrow.
+class HistoryStore:
+    DEFAULT_PATH: str = "issue_history"
+    PARTITION_COLUMN: str = "done_month"
+    SEQUENCE_COLUMN: str = "write_sequence"
+    KEY_COLUMN: str = "Issue Key"
+    DATE_COLUMN: str = "Done Date"
+    ITEMS_COLUMN: str = "Story Points"
+    COLUMNS: Dict[str, str] = {
+        "Issue Key": "string",
+        "Done Date": "string",
+        "Issue Type": "string",
+        "Story Points": "float64",
+        "Duration": "float64",
+        "Lead Time": "float64",
+        "Start": "string",
+        "Done": "string",
+        "Summary": "string"
+    }
+
+    # Last sequence handed out in this process, so appends within the resolution of the clock still grow
+    __last_sequence: int = 0
+
+    def __init__(self, path: str = DEFAULT_PATH) -> None:
+        self.path: str = path
+
+    # Reserves count consecutive sequences, nanoseconds since the epoch, so they also
+    # grow across processes and sort after the rows of earlier runs
+    @classmethod
+    def __next_sequences(cls, count: int) -> int:
+        first: int = max(time.time_ns(), cls.__last_sequence + 1)
+        cls.__last_sequence = first + count - 1
+        return first
+
+    def exists(self) -> bool:
+        for _, _, files in os.walk(self.path):
+            if any(file.endswith(".parquet") for file in files):
+                return True
+        return False
+
+    def append(self, records: pd.DataFrame) -> int:
+        if len(records) == 0:
+            return 0
+
+        batch: pd.DataFrame = records.astype({column: dtype for column, dtype in self.COLUMNS.items() if column in records.columns})
+        # Rows later in the batch win over earlier ones of the same issue
+        first_sequence: int = self.__next_sequences(len(batch))
+        batch[self.SEQUENCE_COLUMN] = pd.Series(range(first_sequence, first_sequence + len(batch)), index=batch.index, dtype="int64")
+        batch_name: str = f"part-{first_sequence:020d}-{uuid.uuid4().hex[:8]}.parquet"
+
+        for month, partition in batch.groupby(batch[self.DATE_COLUMN].str[:7]):
+            partition_path: str = os.path.join(self.path, f"{self.PARTITION_COLUMN}={month}")
+            os.makedirs(partition_path, exist_ok=True)
+            partition.to_parquet(os.path.join(partition_path, batch_name), index=False)
+
+        return len(batch)
+
+    # Reads the given columns of the issues done between start_date and end_date
+    # (both inclusive). If an issue was appended more than once the row with the
+    # highest write sequence wins, before the dates are filtered, so a row that was
+    # replaced by one in another month is not returned either. Rows written before
+    # the sequence existed count as older than all others.
+    def read(self, columns: Optional[List[str]] = None, start_date: Optional[date] = None, end_date: Optional[date] = None) -> pd.DataFrame:
+        columns = list(columns) if columns is not None else list(self.COLUMNS.keys())
+        unknown: List[str] = [column for column in columns if column not in self.COLUMNS]
+        if unknown:
+            raise ValueError(f"Columns {', '.join(unknown)} are not in the history store, it has {', '.join(self.COLUMNS)}")
+
+        if not self.exists():
+            return pd.DataFrame({column: pd.Series(dtype=self.COLUMNS.get(column, "object")) for column in columns})
+
+        import pyarrow.dataset as ds
+
+        # The dataset is read with the full schema, so files written before a column was
+        # added simply return nulls for it, and whole months are skipped by partition.
+        dataset = ds.dataset(self.path, format="parquet", partitioning="hive", schema=self.schema())
+        condition = None
+        if start_date is not None:
+            condition = (ds.field(self.PARTITION_COLUMN) >= start_date.strftime("%Y-%m")) & (ds.field(self.DATE_COLUMN) >= start_date.isoformat())
+        if end_date is not None:
+            until = (ds.field(self.PARTITION_COLUMN) <= end_date.strftime("%Y-%m")) & (ds.field(self.DATE_COLUMN) <= end_date.isoformat())
+            condition = until if condition is None else condition & until
+
+        read_columns: List[str] = list(dict.fromkeys(columns + [self.KEY_COLUMN, self.SEQUENCE_COLUMN]))
+        history: pd.DataFrame = self.__latest(dataset.to_table(columns=read_columns, filter=condition).to_pandas())
+        if condition is not None:
+            # Only the two narrow columns of the whole store are read to find the latest write of every issue
+            latest: pd.DataFrame = self.__latest(dataset.to_table(columns=[self.KEY_COLUMN, self.SEQUENCE_COLUMN]).to_pandas())
+            current: pd.Series = history[self.KEY_COLUMN].map(latest.set_index(self.KEY_COLUMN)[self.SEQUENCE_COLUMN])
+            history = history[history[self.SEQUENCE_COLUMN] == current]
+        history = history.astype({column: dtype for column, dtype in self.COLUMNS.items() if column in columns})
+
+        return history[columns].sort_values(self.DATE_COLUMN if self.DATE_COLUMN in columns else columns[0]).reset_index(drop=True)
+
+    # The last written row per issue, the file order breaks ties between rows without a sequence
+    def __latest(self, history: pd.DataFrame) -> pd.DataFrame:
+        history[self.SEQUENCE_COLUMN] = history[self.SEQUENCE_COLUMN].fillna(-1).astype("int64")
+        return history.sort_values(self.SEQUENCE_COLUMN, kind="stable").drop_duplicates(self.KEY_COLUMN, keep="last")
+
+    def schema(self):
+        import pyarrow as pa
+
+        types: Dict[str, object] = {"string": pa.string(), "float64": pa.float64()}
+        return pa.schema([(column, types[dtype]) for column, dtype in self.COLUMNS.items()]
+                         + [(self.SEQUENCE_COLUMN, pa.int64()), (self.PARTITION_COLUMN, pa.string())])
+
+    def keys(self) -> Set[str]:
+        return set(self.read([self.KEY_COLUMN])[self.KEY_COLUMN])
@@ -3,63 +3,225 @@ import requests
 import json
 import aiohttp
 import asyncio
+import time
 import yaml
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from Profiler import PROFILER
 
 
 class Jira:
     STORYPOINTS = "customfield_10014"
     STORYPOINT_ESTIMATE = "customfield_10029"
+
+    MAX_CONNECTIONS = 20
+    KEEPALIVE_TIMEOUT = 60
+    REQUEST_TIMEOUT = 120
+    # Rate limited (429) and unavailable (503) responses are retried, honouring Retry-After
+    RETRY_STATUSES = (429, 503)
+    MAX_RETRIES = 5
+    RETRY_BACKOFF = 1.0
+    MAX_RETRY_WAIT = 60.0
     
-    def __init__(self):
-        with open('secrets.yaml', 'r') as file:
-            secrets = yaml.safe_load(file)
-        self.API_URL = secrets['API_URL']
-        self.TOKEN = secrets['TOKEN']
+    # Without arguments the url and token are read from secrets.yaml
+    def __init__(self, API_URL=None, TOKEN=None):
+        if API_URL is None:
+            with open('secrets.yaml', 'r') as file:
+                secrets = yaml.safe_load(file)
+            API_URL, TOKEN = secrets['API_URL'], secrets['TOKEN']
+        self.API_URL = API_URL
+        self.TOKEN = TOKEN
+        self.session = None
+        self.bulkChangelogAvailable = True
+        # Search pages that could not be retrieved, their issues are missing from the results
+        self.failedSearchPages = 0
 
     def init(self, API_URL, TOKEN):
         self.API_URL = API_URL
         self.TOKEN = TOKEN
 
-    async def getFromAPI(self, path, query_params=None):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # One long-lived session per Jira instance, so all requests share the
+    # connection pool and keep-alive connections instead of a TCP+TLS setup each.
+    def getSession(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.MAX_CONNECTIONS, limit_per_host=self.MAX_CONNECTIONS,
+                                             keepalive_timeout=self.KEEPALIVE_TIMEOUT, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT))
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def getRetryWait(self, resp, attempt):
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.MAX_RETRY_WAIT)
+            except ValueError:
+                pass
+        return min(self.RETRY_BACKOFF * 2 ** attempt, self.MAX_RETRY_WAIT)
+
+    # Requests are counted per endpoint, with the issue key replaced by a placeholder
+    def getEndpoint(self, path):
+        return re.sub(r"/issue/[^/?]+", "/issue/{key}", path.split("?")[0])
+
+    # Returns (status, text), status is None if the request failed without a response.
+    # Bodies are requested gzip compressed, the profiler counts the bytes on the wire.
+    async def sendRequest(self, method, path, query_params=None, body=None):
         url = self.API_URL + path
         headers = {
             "Authorization": "Basic " + self.TOKEN,
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate"
         }
-        async with aiohttp.ClientSession() as session:
+        session = self.getSession()
+        for attempt in range(self.MAX_RETRIES + 1):
             try:
-                async with session.get(url, headers=headers, params=query_params) as resp:
-                    if resp.status != 200:
-                        print(f"Error retrieving data for url {url}: {await resp.text()}")
-                        return ""
-                    else:
-                        return await resp.text()
+                start = time.perf_counter()
+                async with session.request(method, url, headers=headers, params=query_params, json=body) as resp:
+                    text = await resp.text()
+                    if PROFILER.enabled:
+                        size = resp.content_length if resp.content_length is not None else len(text)
+                        PROFILER.record_request(self.getEndpoint(path), resp.status, size, start, time.perf_counter())
+                    if resp.status in self.RETRY_STATUSES and attempt < self.MAX_RETRIES:
+                        wait = self.getRetryWait(resp, attempt)
+                        print(f"Got {resp.status} for url {url}, retrying in {wait:.1f}s")
+                        await asyncio.sleep(wait)
+                        continue
+                    return resp.status, text
             except Exception as e:
                 print(f"An error occurred: {str(e)}")
-                return ""
-
-
-
-    async def getJQL(self, jql, fields) :
-        issues = []
-        startAt = 0
-        maxResults = 50
-        total = None
-
-        while total is None or startAt < total:
-            query_params = {
-                "jql": jql,
-                "fields": fields,
-                "startAt": startAt,
-                "maxResults": maxResults
-            }
-            response = await self.getFromAPI("/rest/api/2/search", query_params)
-            if response == "":
-                break
-            data = json.loads(response)
-            if total is None:
-                total = data["total"]
-            issues.extend(data["issues"])
-            startAt += maxResults
-
-        return issues
\ No newline at end of file
+                return None, ""
+        return None, ""
+
+    async def getFromAPI(self, path, query_params=None):
+        status, text = await self.sendRequest("GET", path, query_params)
+        if status != 200:
+            if status is not None:
+                print(f"Error retrieving data for url {self.API_URL + path}: {text}")
+            return ""
+        return text
+
+    # JQL reads dates in the timezone of the user's profile. Returns it as a ZoneInfo,
+    # None if it could not be retrieved or is unknown here.
+    async def getTimeZone(self):
+        response = await self.getFromAPI("/rest/api/2/myself")
+        if response == "":
+            return None
+        timeZone = json.loads(response).get("timeZone")
+        try:
+            return ZoneInfo(timeZone) if timeZone else None
+        except (ValueError, ZoneInfoNotFoundError):
+            print(f"Unknown timezone {timeZone} in the Jira profile")
+            return None
+
+    # Jira Cloud caps maxResults at 100 for search, servers that allow less
+    # report the applied value in the response and the remaining pages follow it.
+    MAX_RESULTS = 100
+    PAGE_CONCURRENCY = 5
+
+    # fields is a strict projection, only the listed fields are sent. With
+    # expand="changelog" every issue carries its changelog, Jira Cloud embeds at most
+    # 100 histories per issue and reports the full count in changelog.total.
+    async def getSearchPage(self, jql, fields, startAt, maxResults, expand=None):
+        query_params = {
+            "jql": jql,
+            "fields": fields,
+            "startAt": startAt,
+            "maxResults": maxResults
+        }
+        if expand:
+            query_params["expand"] = expand
+        response = await self.getFromAPI("/rest/api/2/search", query_params)
+        if response == "":
+            return None
+        with PROFILER.stage("jira.parse_search"):
+            return json.loads(response)
+
+    # Yields (startAt, issues) per page. Once the first page reveals the total the
+    # other offsets are fetched concurrently and yielded in the order they arrive.
+    # Pages that fail are skipped and counted in failedSearchPages.
+    async def iterSearchPages(self, jql, fields, maxResults=None, concurrency=None, expand=None):
+        maxResults = maxResults or self.MAX_RESULTS
+        first = await self.getSearchPage(jql, fields, 0, maxResults, expand)
+        if first is None:
+            self.failedSearchPages += 1
+            return
+        yield 0, first["issues"]
+
+        pageSize = first.get("maxResults") or len(first["issues"])
+        if pageSize <= 0:
+            return
+
+        semaphore = asyncio.Semaphore(concurrency or self.PAGE_CONCURRENCY)
+
+        async def getPage(startAt):
+            async with semaphore:
+                return startAt, await self.getSearchPage(jql, fields, startAt, pageSize, expand)
+
+        tasks = [asyncio.create_task(getPage(startAt)) for startAt in range(pageSize, first["total"], pageSize)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                startAt, page = await task
+                if page is None:
+                    self.failedSearchPages += 1
+                    continue
+                yield startAt, page["issues"]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def iterJQL(self, jql, fields, maxResults=None, concurrency=None, expand=None):
+        async for _, issues in self.iterSearchPages(jql, fields, maxResults, concurrency, expand):
+            yield issues
+
+    async def getJQL(self, jql, fields, maxResults=None, concurrency=None, expand=None):
+        pages = [page async for page in self.iterSearchPages(jql, fields, maxResults, concurrency, expand)]
+        return [issue for _, issues in sorted(pages, key=lambda page: page[0]) for issue in issues]
+
+    # True if a changelog embedded in a search result or issue holds all histories
+    @staticmethod
+    def isChangelogComplete(changelog):
+        return changelog is not None and changelog.get("total", 0) <= len(changelog.get("histories", []))
+
+    # Jira Cloud returns the changelogs of up to 1000 issues per request, optionally
+    # only the histories that touch fieldIds. Servers without the endpoint (Jira
+    # Server / Data Center) answer 404, it is not asked again after that.
+    BULK_CHANGELOG_PATH = "/rest/api/3/changelog/bulkfetch"
+    BULK_CHANGELOG_ISSUES = 1000
+    BULK_CHANGELOG_RESULTS = 1000
+
+    # Returns {issue id: histories} for the given issue ids, or None if the server has
+    # no bulk changelog endpoint or the request failed. Only the issues the response
+    # holds are in it, an issue it left out (no permission, no matching histories) is
+    # not taken as one without histories.
+    async def getBulkChangelogs(self, issueIds, fieldIds=("status",)):
+        if not self.bulkChangelogAvailable:
+            return None
+
+        changelogs = {}
+        body = {"issueIdsOrKeys": [str(issueId) for issueId in issueIds], "fieldIds": list(fieldIds), "maxResults": self.BULK_CHANGELOG_RESULTS}
+        while True:
+            status, text = await self.sendRequest("POST", self.BULK_CHANGELOG_PATH, body=body)
+            if status in (404, 405):
+                self.bulkChangelogAvailable = False
+                return None
+            if status != 200:
+                print(f"Error retrieving bulk changelogs: {text}")
+                return None
+
+            with PROFILER.stage("jira.parse_changelogs"):
+                page = json.loads(text)
+            # The histories of one issue can be split over two pages
+            for issueChangelog in page.get("issueChangeLogs", []):
+                changelogs.setdefault(str(issueChangelog["issueId"]), []).extend(issueChangelog.get("changeHistories", []))
+            if not page.get("nextPageToken"):
+                return changelogs
+            body["nextPageToken"] = page["nextPageToken"]
@@ -1,3 +1,4 @@
+import os
 import re
 import json
 from datetime import datetime
@@ -5,103 +6,156 @@ import pandas as pd
 
 import numpy as np
 import aiohttp
+import argparse
 import asyncio
 import Jira
+from ChangelogCache import ChangelogCache
+from HistoryStore import HistoryStore
+from Profiler import PROFILER, Profiler
+from TransitionExtractor import TransitionExtractor, Transitions, parseTimestamp, START_STATUSES, DONE_STATUSES
 
 #######################################################
 # Find all Stories, Tasks , Bugs that were closed in the last x days and lookup up the cycle time for them. (Difference between Done and in Progress)
-# To Do : For bugs Lead time is a better metric ( Duration between Done and Created)
+# Lead time (Duration between Done and Created) is stored next to it, for bugs it is the better metric
 # Results are written to issue-duration.csv
 
 
 JQL = 'status changed to (Done, Closed) DURING (-30d, now()) and project = "Product Group Development" and issuetype in ( Story, Task, Bug,Improvement )'
+# possibly you want to remove some rows that are outliers
+OUTLIERS = ["PSLM0036-200", "	PSLM0036-22", "TDL4044-200","BPS4105-126"]
+# Number of changelog requests that are in flight at the same time
+CHANGELOG_CONCURRENCY = 10
 
 
-#################### MAIN ###################################
-async def main():
-    print("_______________________________________________________________________________________")
-    print("Getting last closed items and updating issue_duration csv, it will opnly add new issues")
-    print("_______________________________________________________________________________________")
+# Only the fields the sync reads, everything else stays on the server
+SEARCH_FIELDS = f"issuetype,summary,resolved,created,updated,{Jira.Jira.STORYPOINTS}"
 
-    jira = Jira.Jira()
-    issues = await jira.getJQL(JQL, fields=f"issuetype,key,summary,resolved,{jira.STORYPOINTS}")
-    try:
-        df = pd.read_csv("issue_duration.csv", sep=";")
-        df.set_index('Issue Key', inplace=True)
-    except FileNotFoundError:
-        df = pd.DataFrame(columns=["Done Date", "Issue Key", "Issue Type", "Story Points", "Duration", "Start", "Done", "Summary"])
-        df.set_index('Issue Key', inplace=True)
-    new_ones=0
-    count:int = len(issues)
-    i:int = 0
-    for issue in issues:
-        i+=1
-        print(f'Processing {i}/{count} issues...', end='\r')
-        issue_key = issue['key']
-        if issue_key not in df.index:
-            
-            issue_type = issue['fields']['issuetype']['name']
-            changelog_url = f'/rest/api/2/issue/{issue_key}?expand=changelog'
-            changelog_response = json.loads(await jira.getFromAPI(changelog_url))
-            changelog = changelog_response['changelog']['histories']
-
-            foundDone = False
-            foundStart = False
-
-            # Parse changelog for transitions
-            for history in changelog:
-                for item in history['items']:
-                    if item['field'] == 'status':
-                        to_status = item['toString']
-                        if to_status == 'Done' or to_status == 'Closed':
-                            to_Done = datetime.strptime(history['created'], '%Y-%m-%dT%H:%M:%S.%f%z')
-                            foundDone = True
-                        if to_status == 'In Progress':
-                            to_Start = datetime.strptime(history['created'], '%Y-%m-%dT%H:%M:%S.%f%z')
-                            foundStart = True
-                            if foundDone:
-                                break
-                if foundDone and foundStart:
-                    break
-
-            # Calculate duration only if both start and done are found
-            if foundDone and foundStart:
-                new_ones += 1
-                duration = (to_Done - to_Start).total_seconds() / 3600 / 24  # Convert duration to days with decimal hours
-
-                points = 0 if issue["fields"][jira.STORYPOINTS] is None else issue["fields"][jira.STORYPOINTS]
-                # Append issue data to the DataFrame
-                df.loc[issue_key] = {
-                    "Done Date": to_Done.strftime('%Y-%m-%d'),
-                    "Issue Type": issue_type,
-                    "Story Points": points,
-                    "Duration": round(duration, 3),
-                    "Start": to_Start.strftime('%Y-%m-%dT%H:%M:%S'),
-                    "Done": to_Done.strftime('%Y-%m-%dT%H:%M:%S'),
-                    "Summary": issue["fields"]["summary"]
-                }
-                print(f'{to_Done.strftime('%Y-%m-%d')}: {issue_type} - {issue_key} - {points} - {round(duration, 3)} - {issue["fields"]["summary"]}')
-
-    # possibly you want to remove some rows that are outliers
-    to_remove = ["PSLM0036-200", "	PSLM0036-22", "TDL4044-200","BPS4105-126"]
-    df.drop(index=to_remove, inplace=True, errors='ignore')
 
-    
-    # Save the updated DataFrame to a CSV file with specified date format
-    df.sort_values(by='Done Date', inplace=True)
+async def fetchChangelog(jira, issue_key, semaphore):
+    async with semaphore:
+        response = await jira.getFromAPI(f'/rest/api/2/issue/{issue_key}', {"expand": "changelog", "fields": "created"})
+    return response if response != "" else None
+
+
+# Streams the JQL result page by page and resolves the transitions of new issues
+# while the remaining pages are still coming in. Issues whose 'updated' timestamp
+# matches the cache are answered from it. The others are resolved from the changelog
+# embedded in the search page (expandChangelog). If the server capped it, or nothing
+# was embedded, the changelogs are fetched in batches from the bulk changelog endpoint,
+# and one issue at a time on servers without it or for issues the bulk response left
+# out. The transitions are returned in the same order as the issues, together with
+# what failed: the number of search pages and the issues whose changelog could not be
+# retrieved.
+async def fetchNewTransitions(jira, jql, known_keys, cache, extractor, concurrency=CHANGELOG_CONCURRENCY, expandChangelog=True):
+    semaphore = asyncio.Semaphore(concurrency)
+    new_issues = []
+    tasks = []
+    pending = []
+    sources = {"search": 0, "bulk": 0, "issue": 0}
+    failed = {"pages": 0, "issues": []}
+    failedPagesBefore = jira.failedSearchPages
+    fetches = 0
+    done = 0
+
+    def progress(count):
+        nonlocal done
+        done += count
+        print(f'Fetching changelogs {done}/{fetches}...', end='\r')
+
+    def resolveHistories(issue, histories):
+        with PROFILER.stage("sync.extract_transitions"):
+            transitions = extractor.extract(histories, issue['fields'].get('created'))
+        with PROFILER.stage("sync.cache_write"):
+            cache.put(issue['key'], issue['fields'].get('updated'), json.dumps(histories), transitions.start, transitions.done)
+        return transitions
+
+    async def fetchWithProgress(issue):
+        response = await fetchChangelog(jira, issue['key'], semaphore)
+        sources["issue"] += 1
+        progress(1)
+        if response is None:
+            failed["issues"].append(issue)
+            return Transitions(None, None)
+        with PROFILER.stage("sync.extract_transitions"):
+            transitions = extractor.extractFromResponse(response, issue['fields'].get('created'))
+        with PROFILER.stage("sync.cache_write"):
+            cache.put(issue['key'], issue['fields'].get('updated'), response, transitions.start, transitions.done)
+        return transitions
+
+    async def fetchBatch(batch):
+        async with semaphore:
+            changelogs = await jira.getBulkChangelogs([issue['id'] for issue in batch])
+        if changelogs is None:
+            return await asyncio.gather(*(fetchWithProgress(issue) for issue in batch))
+        # Issues the bulk response left out are fetched one by one, a failure there counts
+        missing = [issue for issue in batch if issue['id'] not in changelogs]
+        refetched = dict(zip([issue['id'] for issue in missing], await asyncio.gather(*(fetchWithProgress(issue) for issue in missing))))
+        sources["bulk"] += len(batch) - len(missing)
+        progress(len(batch) - len(missing))
+        return [refetched[issue['id']] if issue['id'] in refetched else resolveHistories(issue, changelogs[issue['id']]) for issue in batch]
+
+    async def fromBatch(batchTask, position):
+        return (await batchTask)[position]
+
+    # pending holds (task index, issue) of the issues that wait for the next batch
+    def flushPending():
+        batchTask = asyncio.create_task(fetchBatch([issue for _, issue in pending]))
+        for position, (index, _) in enumerate(pending):
+            tasks[index] = fromBatch(batchTask, position)
+        pending.clear()
+
+    async for page in jira.iterJQL(jql, fields=SEARCH_FIELDS, expand="changelog" if expandChangelog else None):
+        for issue in page:
+            if issue['key'] in known_keys:
+                continue
+            known_keys.add(issue['key'])
+            new_issues.append(issue)
+            with PROFILER.stage("sync.cache_read"):
+                cached = cache.get(issue['key'], issue['fields'].get('updated'))
+            if cached is not None:
+                created = issue['fields'].get('created')
+                tasks.append(asyncio.sleep(0, result=Transitions(*cached, parseTimestamp(created) if created else None)))
+            elif jira.isChangelogComplete(issue.get('changelog')):
+                sources["search"] += 1
+                tasks.append(asyncio.sleep(0, result=resolveHistories(issue, issue['changelog']['histories'])))
+            else:
+                fetches += 1
+                pending.append((len(tasks), issue))
+                tasks.append(None)
+                if len(pending) >= jira.BULK_CHANGELOG_ISSUES:
+                    flushPending()
+
+    if pending:
+        flushPending()
+    transitions = await asyncio.gather(*tasks)
+    if fetches > 0:
+        print()
+    cached = len(new_issues) - sum(sources.values())
+    print(f"Resolved {sources['search']} changelogs from the search, fetched {sources['bulk']} in bulk and {sources['issue']} per issue, "
+          f"{cached} answered from the cache")
+    failed["pages"] = jira.failedSearchPages - failedPagesBefore
+    if failed["pages"] > 0 or failed["issues"]:
+        print(f"Failed to retrieve {failed['pages']} search pages and {len(failed['issues'])} changelogs")
+    return new_issues, transitions, failed
+
+
+# Where the next sync starts: the start of this one if it retrieved everything, the
+# earliest update of an issue whose changelog failed, so that issue is asked for again,
+# and None (keep the previous watermark) if a search page failed, its issues are unknown.
+def nextWatermark(sync_started, failed):
+    if failed["pages"] > 0:
+        return None
+    updates = [issue['fields'].get('updated') for issue in failed["issues"]]
+    if None in updates:
+        return None
+    return min([sync_started] + [parseTimestamp(updated) for updated in updates])
+
+
+# Writes issue_duration.csv and the derived per day, throughput and resampled csv files
+def exportCsv(df):
     df.reset_index().to_csv("issue_duration.csv", index=False, sep=";")
-    print(f"Added {new_ones} new issues to issue_duration.csv")
-    # Saving the issues to excel 
-    # Calculate mean duration for Bug, Task, and Story items
-    mean_bug_duration = df[df['Issue Type'] == 'Bug']['Duration'].mean()
-    mean_task_duration = df[df['Issue Type'] == 'Task']['Duration'].mean()
-    mean_story_duration = df[df['Issue Type'] == 'Story']['Duration'].mean()
+    print(f"Exported {len(df)} issues to issue_duration.csv")
 
-    print(f"Mean Bug Duration: {mean_bug_duration:.3f} days" )
-    print(f"Mean Task Duration: {mean_task_duration:.3f} days" )
-    print(f"Mean Story Duration: {mean_story_duration:.3f} days" )
-   
-   
     pivot_table = df.pivot_table(index='Done Date', columns='Issue Type', values='Story Points', aggfunc='sum', fill_value=0)
     pivot_table2 = df.pivot_table(index='Done Date', columns='Issue Type', values='Story Points', aggfunc='count', fill_value=0)
     try:
@@ -138,7 +192,129 @@ async def main():
     resampled.to_csv("issues_by_date_biweekly.csv", sep=";")
     resampled = pivot_table.resample('ME', on='Done Date').sum()
     resampled.to_csv("issues_by_date_monthly.csv", sep=";")
-   
+
+
+#################### MAIN ###################################
+async def main(rebuild=False, cache_path=ChangelogCache.DEFAULT_PATH, retention_days=ChangelogCache.DEFAULT_RETENTION_DAYS,
+               store_path=HistoryStore.DEFAULT_PATH, export_csv=True, start_statuses=START_STATUSES, done_statuses=DONE_STATUSES,
+               expand_changelog=True):
+    print("_______________________________________________________________________________________")
+    print("Getting last closed items and updating the issue history, it will only add new issues")
+    print("_______________________________________________________________________________________")
+
+    store = HistoryStore(store_path)
+    if not store.exists() and os.path.exists("issue_duration.csv"):
+        imported = store.append(pd.read_csv("issue_duration.csv", sep=";"))
+        print(f"Imported {imported} issues from issue_duration.csv into {store_path}")
+
+    with ChangelogCache(cache_path) as cache:
+        # A rebuild also fetches the issues that are already in the store again, their
+        # new rows replace the stored ones
+        known_keys = set() if rebuild else store.keys()
+        if rebuild:
+            print(f"Rebuilding the changelog cache {cache_path} and the issues in {store_path}")
+            cache.clear()
+
+        jira = Jira.Jira()
+        try:
+            # Only ask for issues updated since the last complete sync. JQL compares in
+            # minutes in the timezone of the Jira user, the local one if it is unknown.
+            time_zone = await jira.getTimeZone() or datetime.now().astimezone().tzinfo
+            last_sync = cache.getWatermark()
+            jql = JQL if last_sync is None else f'({JQL}) and updated >= "{last_sync.astimezone(time_zone).strftime("%Y/%m/%d %H:%M")}"'
+            sync_started = datetime.now(time_zone)
+
+            extractor = TransitionExtractor(start_statuses, done_statuses)
+            with PROFILER.stage("sync.fetch") as stage:
+                new_issues, transitions, failed = await fetchNewTransitions(jira, jql, known_keys, cache, extractor, expandChangelog=expand_changelog)
+                stage.add(issues=len(new_issues))
+        finally:
+            await jira.close()
+
+        watermark = nextWatermark(sync_started, failed)
+        if watermark is not None:
+            cache.setWatermark(watermark)
+        else:
+            print("The sync is incomplete, the next one starts from the previous watermark again")
+        evicted = cache.evict(retention_days)
+        if evicted > 0:
+            print(f"Evicted {evicted} changelogs older than {retention_days} days from the cache")
+
+    records = []
+    count:int = len(new_issues)
+    i:int = 0
+    for issue, issue_transitions in zip(new_issues, transitions):
+        i+=1
+        print(f'Processing {i}/{count} issues...', end='\r')
+        issue_key = issue['key']
+        issue_type = issue['fields']['issuetype']['name']
+
+        # Keep the issue only if both start and done are found
+        if issue_transitions.complete and issue_key not in OUTLIERS:
+            to_Start, to_Done = issue_transitions.start, issue_transitions.done
+            duration = issue_transitions.cycle_time
+            lead_time = issue_transitions.lead_time
+
+            points = 0 if issue["fields"][jira.STORYPOINTS] is None else issue["fields"][jira.STORYPOINTS]
+            records.append({
+                "Issue Key": issue_key,
+                "Done Date": to_Done.strftime('%Y-%m-%d'),
+                "Issue Type": issue_type,
+                "Story Points": points,
+                "Duration": round(duration, 3),
+                "Lead Time": round(lead_time, 3) if lead_time is not None else None,
+                "Start": to_Start.strftime('%Y-%m-%dT%H:%M:%S'),
+                "Done": to_Done.strftime('%Y-%m-%dT%H:%M:%S'),
+                "Summary": issue["fields"]["summary"]
+            })
+            print(f'{to_Done.strftime("%Y-%m-%d")}: {issue_type} - {issue_key} - {points} - {round(duration, 3)} - {issue["fields"]["summary"]}')
+
+    # One DataFrame per sync, appended to the store as a new batch
+    with PROFILER.stage("sync.store_append"):
+        new_ones = store.append(pd.DataFrame.from_records(records, columns=list(HistoryStore.COLUMNS.keys())))
+    print(f"Rewrote {new_ones} issues in {store_path}" if rebuild else f"Added {new_ones} new issues to {store_path}")
+
+    with PROFILER.stage("sync.store_read"):
+        df = store.read().set_index('Issue Key')
+    df.drop(index=OUTLIERS, inplace=True, errors='ignore')
+    if len(df) == 0:
+        return
+
+    # Calculate mean duration for Bug, Task, and Story items
+    mean_bug_duration = df[df['Issue Type'] == 'Bug']['Duration'].mean()
+    mean_task_duration = df[df['Issue Type'] == 'Task']['Duration'].mean()
+    mean_story_duration = df[df['Issue Type'] == 'Story']['Duration'].mean()
+
+    print(f"Mean Bug Duration: {mean_bug_duration:.3f} days" )
+    print(f"Mean Task Duration: {mean_task_duration:.3f} days" )
+    print(f"Mean Story Duration: {mean_story_duration:.3f} days" )
+
+    if export_csv:
+        with PROFILER.stage("sync.export_csv"):
+            exportCsv(df)
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--Rebuild", default=False, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--Cache", default=ChangelogCache.DEFAULT_PATH)
+    parser.add_argument("--RetentionDays", default=str(ChangelogCache.DEFAULT_RETENTION_DAYS))
+    parser.add_argument("--Store", default=HistoryStore.DEFAULT_PATH)
+    parser.add_argument("--ExportCsv", default=True, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--StartStatuses", nargs="+", default=list(START_STATUSES))
+    parser.add_argument("--DoneStatuses", nargs="+", default=list(DONE_STATUSES))
+    parser.add_argument("--ExpandChangelog", default=True, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--Profile", default=False, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--ProfileStats", default=None)
+    parser.add_argument("--ProfileTrace", default=None)
+    args = parser.parse_args()
+
+    profiling = args.Profile or args.ProfileStats is not None or args.ProfileTrace is not None
+    if profiling:
+        PROFILER.enable(trace=args.ProfileTrace is not None)
+    try:
+        with Profiler.cprofile(args.ProfileStats):
+            asyncio.run(main(args.Rebuild, args.Cache, int(args.RetentionDays), args.Store, args.ExportCsv, args.StartStatuses, args.DoneStatuses, args.ExpandChangelog))
+    finally:
+        if profiling:
+            PROFILER.print_report(args.ProfileTrace)
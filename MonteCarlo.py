@@ -1,98 +1,280 @@
 import argparse
 import datetime
+import os
 
-from MonteCarloService import MonteCarloService
-import pandas as pd
-
-parser = argparse.ArgumentParser()
-parser.add_argument("--FileName", default='issue_throughput_60d.csv')
-parser.add_argument("--History", default="60")
-parser.add_argument("--Delimeter", default=";")
-parser.add_argument("--ClosedDateColumn", default="Done Date")
-parser.add_argument("--DateFormat", default="%Y-%m-%d")
-parser.add_argument("--ItemsColumn", default="Points")
-parser.add_argument("--StartDate", default = "01.05.2024")
-parser.add_argument("--TargetDate", default="01.06.2024")
-parser.add_argument("--TargetDateFormat", default="%d.%m.%Y")
-parser.add_argument("--RemainingItems", default="500")
-parser.add_argument("--SaveCharts", default=True, action=argparse.BooleanOptionalAction)
-parser.add_argument("--ItemsName", default = "Points")
-
-args = parser.parse_args()
-
-file_name = args.FileName
-delimeter = args.Delimeter
-closed_date_column = args.ClosedDateColumn
-date_format = args.DateFormat
-items_column = args.ItemsColumn
-start_date = datetime.datetime.strptime(args.StartDate, args.TargetDateFormat).date()
-history = int(args.History)
-remaining_items = int(args.RemainingItems)
-target_date = datetime.datetime.strptime(args.TargetDate, args.TargetDateFormat).date()
-items_name = args.ItemsName
-
-monte_carlo_service = MonteCarloService(history, args.SaveCharts)
-
-def get_closed_items_history():    
-    #work_items = csv_service.get_closed_items(file_name, delimeter, closed_date_column, date_format,items_column=items_column)
-    work_items =  pd.read_csv(file_name, sep=delimeter)
-    closed_items_history = work_items[[closed_date_column,items_column]]
-    closed_items_history=closed_items_history.rename(columns={items_column: 'Items'})
-    return closed_items_history
-
-print("================================================================")
-print("Starting Monte Carlo Simulation...")
-print("================================================================")  
-print("Parameters:")
-print(f"FileName: {args.FileName}")
-#print(f"Delimeter: {args.Delimeter}")
-#print(f"ClosedDateColumn: {args.ClosedDateColumn}")
-#print(f"Items cloumn: {args.ItemsColumn}")
-print(f"History: {args.History}")
-print(f"StartDate: {args.StartDate}")
-print(f"TargetDate: {args.TargetDate}")
-print(f"RemainingItems: {args.RemainingItems}")
-print("----------------------------------------------------------------")
-   
-closed_items_history = get_closed_items_history()        
-if len(closed_items_history) < 1:
-    print("No closed items - skipping prediction")
-    exit()
-
-print(f"Running simulation on how many points can be done between {start_date} and {target_date}...")
-## Run How Many Predictions via Monte Carlo Simulation for our specified target date
-predictions_howmany_50 = predictions_howmany_70 = predictions_howmany_85 = predictions_howmany_95 = 0
-if target_date:
-    (predictions_howmany_50, predictions_howmany_70, predictions_howmany_85, predictions_howmany_95) = \
-        monte_carlo_service.how_many(start_date,target_date, closed_items_history,f"How Many {items_name} will be done between {start_date} and {target_date} based on last {history} days performance")
-           
-
-print(f"Running simulation on when {remaining_items} {items_name} will be done.")
-## Run When Predictions via Monte Carlo Simulation - only possible if we have specified how many items are remaining
-predictions_when_50 = predictions_when_70 = predictions_when_85 = predictions_when_95 = datetime.date.today()
-predictions_targetdate_likelyhood = None
-
-if remaining_items > 0:
-    (predictions_when_50, predictions_when_70, predictions_when_85, predictions_when_95, predictions_targetdate_likelyhood) = \
-        monte_carlo_service.when(remaining_items, closed_items_history, start_date,target_date,f"When will {remaining_items} {items_name} be done based on last {history} days performance")
-
-    
-print("================================================================")
-print("Summary")
-print("================================================================")
-
-print(f"How many {items_name} will be between {start_date} and {target_date}:")
-print("50%: {0}".format(predictions_howmany_50))
-print("70%: {0}".format(predictions_howmany_70))
-print("85%: {0}".format(predictions_howmany_85))
-print("95%: {0}".format(predictions_howmany_95))
-print("----------------------------------------")
-
-if remaining_items != 0:
-    print(f"When will {remaining_items} {items_name} be done:")
-    print(f"50%: {predictions_when_50}")
-    print(f"70%: {predictions_when_70}")
-    print(f"85%: {predictions_when_85}")
-    print(f"95%: {predictions_when_95}")
+# Only light imports at module level: pandas is needed for --Store and scenario
+# tables only, matplotlib is imported by the chart renderer when a png is written.
+from ChartRenderer import ChartRenderer
+from DailyThroughput import DailyThroughput
+from MonteCarloService import MonteCarloService, percentile_label
+from Profiler import PROFILER, Profiler
+from SamplingStrategy import DEFAULT_HALF_LIFE, DEFAULT_WEEKDAY_WEIGHTS, SamplingStrategy
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--FileName", default='issue_throughput_60d.csv')
+    parser.add_argument("--Store", default=None)
+    parser.add_argument("--History", default="60")
+    parser.add_argument("--Delimeter", default=";")
+    parser.add_argument("--ClosedDateColumn", default="Done Date")
+    parser.add_argument("--DateFormat", default="%Y-%m-%d")
+    parser.add_argument("--ItemsColumn", default=None, help='defaults to "Points", with --Store to "Story Points"')
+    parser.add_argument("--StartDate", default = "01.05.2024")
+    parser.add_argument("--TargetDate", default="01.06.2024")
+    parser.add_argument("--TargetDateFormat", default="%d.%m.%Y")
+    parser.add_argument("--RemainingItems", default="500")
+    parser.add_argument("--SaveCharts", default=True, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--ChartFormat", default="png", choices=ChartRenderer.FORMATS)
+    parser.add_argument("--ItemsName", default = "Points")
+    parser.add_argument("--Engine", default="numpy", choices=MonteCarloService.ENGINES)
+    parser.add_argument("--Trials", default="100000")
+    parser.add_argument("--Seed", default=None)
+    parser.add_argument("--Workers", default="1")
+    parser.add_argument("--Adaptive", default=False, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--Tolerance", default="1")
+    parser.add_argument("--MaxTrials", default="10000000")
+    parser.add_argument("--TargetDates", nargs="+", default=None)
+    parser.add_argument("--RemainingItemsList", nargs="+", default=None)
+    parser.add_argument("--ScenariosFile", default=None)
+    parser.add_argument("--TeamFiles", nargs="+", default=None)
+    parser.add_argument("--TeamNames", nargs="+", default=None)
+    parser.add_argument("--TeamRemainingItems", nargs="+", default=None)
+    parser.add_argument("--CorrelatedTeams", default=False, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--PortfolioFile", default=None)
+    parser.add_argument("--Percentiles", nargs="+", default=["50", "70", "85", "95"])
+    parser.add_argument("--Sampling", default="uniform", choices=SamplingStrategy.NAMES)
+    parser.add_argument("--HalfLife", default=str(DEFAULT_HALF_LIFE))
+    parser.add_argument("--WeekdayWeights", nargs=7, default=[f"{weight:g}" for weight in DEFAULT_WEEKDAY_WEIGHTS])
+    parser.add_argument("--HolidaysFile", default=None)
+    parser.add_argument("--Backtest", default=False, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--BacktestFrom", default=None)
+    parser.add_argument("--BacktestTo", default=None)
+    parser.add_argument("--BacktestStep", default="7")
+    parser.add_argument("--BacktestFile", default=None)
+    parser.add_argument("--Profile", default=False, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--ProfileStats", default=None)
+    parser.add_argument("--ProfileTrace", default=None)
+
+    args = parser.parse_args(argv)
+
+    if args.Store:
+        from HistoryStore import HistoryStore
+
+        args.ItemsColumn = args.ItemsColumn or HistoryStore.ITEMS_COLUMN
+        numeric_columns = [column for column, dtype in HistoryStore.COLUMNS.items() if dtype == "float64"]
+        if args.ItemsColumn not in numeric_columns:
+            parser.error(f"--ItemsColumn {args.ItemsColumn} is not a numeric column of the history store, use one of {', '.join(numeric_columns)}")
+    args.ItemsColumn = args.ItemsColumn or "Points"
+
+    return args
+
+
+def get_closed_items_history(args, monte_carlo_service, start_date):
+    if args.Store:
+        from HistoryStore import HistoryStore
+
+        closed_items_history = monte_carlo_service.read_closed_items_history(HistoryStore(args.Store), start_date, args.ItemsColumn)
+        return DailyThroughput(closed_items_history)
+
+    # Plain date/items csv files are read without pandas
+    return DailyThroughput.from_csv(args.FileName, args.Delimeter, args.ClosedDateColumn, args.ItemsColumn, args.DateFormat)
+
+
+def print_convergence(convergence, unit):
+    if convergence is None:
+        return
+    status = "converged" if convergence.converged else "stopped at the trial budget"
+    precision = ", ".join(f"{percentile_label(percentile)}: +/-{value:g}" for percentile, value in convergence.precision.items())
+    print(f"Trials used: {convergence.trials} ({status}), precision in {unit}: {precision}")
+
+
+def run_scenarios(args, monte_carlo_service, start_date, closed_items_history):
+    target_dates = [datetime.datetime.strptime(day, args.TargetDateFormat).date() for day in (args.TargetDates or [args.TargetDate])]
+    remaining_items_list = [int(items) for items in (args.RemainingItemsList or [args.RemainingItems])]
+
+    print(f"Running scenarios for {len(target_dates)} target dates and {len(remaining_items_list)} backlog sizes...")
+    scenarios = monte_carlo_service.scenarios(start_date, target_dates, remaining_items_list, closed_items_history)
+
+    print("================================================================")
+    print("Scenarios")
+    print("================================================================")
+    print(scenarios.to_string(index=False))
+
+    if args.ScenariosFile:
+        scenarios.to_csv(args.ScenariosFile, index=False, sep=args.Delimeter)
+        print(f"Scenarios written to {args.ScenariosFile}")
+
+
+def run_portfolio(args, monte_carlo_service, start_date, target_date):
+    team_names = args.TeamNames or [os.path.splitext(os.path.basename(file_name))[0] for file_name in args.TeamFiles]
+    remaining_items_list = [int(items) for items in (args.TeamRemainingItems or [args.RemainingItems] * len(args.TeamFiles))]
+    if len(remaining_items_list) != len(args.TeamFiles):
+        raise ValueError("--TeamRemainingItems needs one value per team file")
+
+    with PROFILER.stage("cli.read_history"):
+        team_histories = [DailyThroughput.from_csv(file_name, args.Delimeter, args.ClosedDateColumn, args.ItemsColumn, args.DateFormat)
+                          for file_name in args.TeamFiles]
+
+    sampling = "correlated" if args.CorrelatedTeams else "independent"
+    print(f"Running portfolio simulation for {len(team_histories)} teams ({sampling} sampling)...")
+    portfolio = monte_carlo_service.portfolio(start_date, team_histories, remaining_items_list, team_names, target_date, args.CorrelatedTeams,
+                                              f"When will all {len(team_histories)} teams be done based on last {args.History} days performance")
+
+    print("================================================================")
+    print("Portfolio")
+    print("================================================================")
+    print(portfolio.to_string(index=False))
+
+    if args.PortfolioFile:
+        portfolio.to_csv(args.PortfolioFile, index=False, sep=args.Delimeter)
+        print(f"Portfolio written to {args.PortfolioFile}")
+
+
+# The backtest needs the whole history, not only the window before the start date
+def get_full_closed_items_history(args):
+    if args.Store:
+        from HistoryStore import HistoryStore
+
+        history_store = HistoryStore(args.Store)
+        return DailyThroughput(history_store.read([history_store.DATE_COLUMN, args.ItemsColumn]), history_store.DATE_COLUMN, args.ItemsColumn)
+
+    return DailyThroughput.from_csv(args.FileName, args.Delimeter, args.ClosedDateColumn, args.ItemsColumn, args.DateFormat)
+
+
+def run_backtest(args, monte_carlo_service, start_date, target_date):
+    from Backtest import Backtest
+
+    with PROFILER.stage("cli.read_history"):
+        closed_items_history = get_full_closed_items_history(args)
+    if closed_items_history.record_count < 1:
+        print("No closed items - skipping backtest")
+        return
+
+    # The horizon and backlog of the forecast are replayed at every cutoff
+    backtest = Backtest(monte_carlo_service, closed_items_history, (target_date - start_date).days, int(args.RemainingItems), int(args.BacktestStep))
+    first_cutoff = datetime.datetime.strptime(args.BacktestFrom, args.TargetDateFormat).date() if args.BacktestFrom else None
+    last_cutoff = datetime.datetime.strptime(args.BacktestTo, args.TargetDateFormat).date() if args.BacktestTo else None
+    cutoffs = backtest.cutoffs(first_cutoff, last_cutoff)
+
+    print(f"Backtesting {len(cutoffs)} cutoffs from {cutoffs[0]} to {cutoffs[-1]}, {backtest.horizon_days} days and {backtest.remaining_items} {args.ItemsName} ahead...")
+    results = backtest.run(cutoffs)
+
+    print("================================================================")
+    print("Backtest")
+    print("================================================================")
+    print(backtest.summary(results).to_string(index=False))
+
+    if args.BacktestFile:
+        results.to_csv(args.BacktestFile, index=False, sep=args.Delimeter)
+        print(f"Backtest results written to {args.BacktestFile}")
+
+
+def forecast(args, monte_carlo_service, start_date, target_date):
+    if args.TeamFiles:
+        run_portfolio(args, monte_carlo_service, start_date, target_date)
+        return
+    if args.Backtest:
+        run_backtest(args, monte_carlo_service, start_date, target_date)
+        return
+
+    history = int(args.History)
+    remaining_items = int(args.RemainingItems)
+    items_name = args.ItemsName
+
+    with PROFILER.stage("cli.read_history"):
+        closed_items_history = get_closed_items_history(args, monte_carlo_service, start_date)
+    if closed_items_history.record_count < 1:
+        print("No closed items - skipping prediction")
+        return
+
+    if args.TargetDates or args.RemainingItemsList:
+        run_scenarios(args, monte_carlo_service, start_date, closed_items_history)
+        return
+
+    print(f"Running simulation on how many points can be done between {start_date} and {target_date}...")
+    ## Run How Many Predictions via Monte Carlo Simulation for our specified target date
+    predictions_howmany = [0] * len(monte_carlo_service.percentiles)
+    howmany_convergence = when_convergence = None
+    if target_date:
+        predictions_howmany = monte_carlo_service.how_many(start_date,target_date, closed_items_history,f"How Many {items_name} will be done between {start_date} and {target_date} based on last {history} days performance")
+        howmany_convergence = monte_carlo_service.last_convergence
+
+    print(f"Running simulation on when {remaining_items} {items_name} will be done.")
+    ## Run When Predictions via Monte Carlo Simulation - only possible if we have specified how many items are remaining
+    predictions_when = [datetime.date.today()] * len(monte_carlo_service.percentiles)
+    predictions_targetdate_likelyhood = None
+
+    if remaining_items > 0:
+        *predictions_when, predictions_targetdate_likelyhood = \
+            monte_carlo_service.when(remaining_items, closed_items_history, start_date,target_date,f"When will {remaining_items} {items_name} be done based on last {history} days performance")
+        when_convergence = monte_carlo_service.last_convergence
+
+    print("================================================================")
+    print("Summary")
+    print("================================================================")
+
+    print(f"How many {items_name} will be between {start_date} and {target_date}:")
+    for percentile, prediction in zip(monte_carlo_service.percentiles, predictions_howmany):
+        print(f"{percentile_label(percentile)}: {prediction}")
+    print_convergence(howmany_convergence, items_name)
     print("----------------------------------------")
-    print(f"Chance of finishing the {remaining_items} remaining {items_name } till {target_date}: {predictions_targetdate_likelyhood}%")
\ No newline at end of file
+
+    if remaining_items != 0:
+        print(f"When will {remaining_items} {items_name} be done:")
+        for percentile, prediction in zip(monte_carlo_service.percentiles, predictions_when):
+            print(f"{percentile_label(percentile)}: {prediction}")
+        print_convergence(when_convergence, "days")
+        print("----------------------------------------")
+        print(f"Chance of finishing the {remaining_items} remaining {items_name } till {target_date}: {predictions_targetdate_likelyhood}%")
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    start_date = datetime.datetime.strptime(args.StartDate, args.TargetDateFormat).date()
+    history = int(args.History)
+    target_date = datetime.datetime.strptime(args.TargetDate, args.TargetDateFormat).date()
+
+    seed = int(args.Seed) if args.Seed is not None else None
+    holidays = SamplingStrategy.read_holidays(args.HolidaysFile, args.DateFormat) if args.HolidaysFile else []
+    sampling = SamplingStrategy(args.Sampling, float(args.HalfLife), [float(weight) for weight in args.WeekdayWeights], holidays)
+
+    monte_carlo_service = MonteCarloService(history, args.SaveCharts, trials=int(args.Trials), engine=args.Engine, seed=seed, workers=int(args.Workers),
+                                            adaptive=args.Adaptive, tolerance=float(args.Tolerance), max_trials=int(args.MaxTrials),
+                                            chart_format=args.ChartFormat, percentiles=[float(percentile) / 100 for percentile in args.Percentiles],
+                                            sampling=sampling)
+
+    print("================================================================")
+    print("Starting Monte Carlo Simulation...")
+    print("================================================================")
+    print("Parameters:")
+    print(f"FileName: {args.Store or args.FileName}")
+    #print(f"Delimeter: {args.Delimeter}")
+    #print(f"ClosedDateColumn: {args.ClosedDateColumn}")
+    #print(f"Items cloumn: {args.ItemsColumn}")
+    print(f"History: {args.History}")
+    print(f"StartDate: {args.StartDate}")
+    print(f"TargetDate: {args.TargetDate}")
+    print(f"RemainingItems: {args.RemainingItems}")
+    print(f"Engine: {args.Engine}")
+    print(f"Trials: {args.Trials}")
+    print(f"Seed: {args.Seed}")
+    print(f"Sampling: {args.Sampling}")
+    print("----------------------------------------------------------------")
+
+    profiling = args.Profile or args.ProfileStats is not None or args.ProfileTrace is not None
+    if profiling:
+        PROFILER.enable(trace=args.ProfileTrace is not None)
+
+    try:
+        with Profiler.cprofile(args.ProfileStats):
+            forecast(args, monte_carlo_service, start_date, target_date)
+    finally:
+        monte_carlo_service.close()
+        if profiling:
+            PROFILER.print_report(args.ProfileTrace)
+
+
+if __name__ == "__main__":
+    main()
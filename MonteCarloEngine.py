@@ -0,0 +1,635 @@
+import math
+import numpy as np
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from AliasTable import AliasTable
+from Histogram import Histogram
+
+# Upper bound for the number of trial x day cells that are drawn at once. Keeps
+# a single chunk at roughly 32 MB of int64 draws regardless of the horizon.
+DEFAULT_MAX_CHUNK_CELLS: int = 4_000_000
+
+
+# Fractional daily throughput (e.g. 0.5 story points) is simulated on a fixed-point
+# scale: the smallest power of 10 up to this one that makes every day whole. Values
+# with more decimals are rounded on this scale.
+MAX_THROUGHPUT_SCALE: int = 1000
+
+
+def throughput_scale(monte_carlo_data: Sequence) -> int:
+    data: np.ndarray = np.asarray(monte_carlo_data, dtype=float)
+    scale: int = 1
+    while scale < MAX_THROUGHPUT_SCALE and not np.allclose(data * scale, np.round(data * scale), rtol=0, atol=1e-9):
+        scale *= 10
+    return scale
+
+
+def as_throughput_array(monte_carlo_data: Sequence, scale: int = 1) -> np.ndarray:
+    data: np.ndarray = np.asarray(monte_carlo_data, dtype=float)
+
+    if data.size == 0:
+        raise ValueError("Cannot run a simulation without any throughput history")
+
+    if np.any(data < 0):
+        raise ValueError("Daily throughput must not be negative")
+
+    return np.round(data * scale).astype(np.int64)
+
+
+# how_many outcomes on the fixed-point scale back to items, a partly finished item does not count
+def floor_items(histogram: Histogram, scale: int) -> Histogram:
+    if scale == 1 or not histogram:
+        return histogram
+    counts: np.ndarray = np.bincount(histogram.values // scale, weights=histogram.counts)
+    return Histogram(counts.astype(histogram.counts.dtype))
+
+
+def check_alias_table(data: np.ndarray, alias_table: Optional[AliasTable]) -> None:
+    if alias_table is not None and len(alias_table) != len(data):
+        raise ValueError(f"The sampling weights cover {len(alias_table)} days, the throughput history {len(data)}")
+
+
+# Indices of the drawn history days: uniform, or weighted through the alias table
+def draw_days(rng: np.random.Generator, days: int, size: Union[int, Tuple[int, ...]], alias_table: Optional[AliasTable] = None,
+              dtype: type = np.int64) -> np.ndarray:
+    if alias_table is None:
+        return rng.integers(0, days, size=size, dtype=dtype)
+    return alias_table.draw(rng, size, dtype)
+
+
+# Expected items per drawn day
+def mean_throughput(data: np.ndarray, alias_table: Optional[AliasTable] = None) -> float:
+    return float(data.mean() if alias_table is None else np.dot(data, alias_table.probabilities))
+
+
+def add_counts(total: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    if len(counts) > len(total):
+        counts = counts.copy()
+        counts[:len(total)] += total
+        return counts
+
+    total[:len(counts)] += counts
+    return total
+
+
+# Result of a portfolio shard: the completion and per team counts, as arrays in the
+# shard and as histograms once collected, and per team the number of trials in which
+# it finished last, a plain array indexed by team that is summed over the shards
+class PortfolioCounts(NamedTuple):
+    completion: Union[np.ndarray, Histogram]
+    teams: List[Union[np.ndarray, Histogram]]
+    critical: np.ndarray
+
+
+# Shards return either one histogram, a list of histograms (scenarios) or the portfolio counts
+def to_histograms(counts: Union[np.ndarray, List[np.ndarray], PortfolioCounts]) -> Union[Histogram, List[Histogram], PortfolioCounts]:
+    if isinstance(counts, PortfolioCounts):
+        return PortfolioCounts(Histogram(counts.completion), [Histogram(team_counts) for team_counts in counts.teams], counts.critical)
+    if isinstance(counts, list):
+        return [Histogram(shard_counts) for shard_counts in counts]
+
+    return Histogram(counts)
+
+
+def merge_histograms(total: Union[Histogram, List[Histogram], PortfolioCounts],
+                     histograms: Union[Histogram, List[Histogram], PortfolioCounts]) -> Union[Histogram, List[Histogram], PortfolioCounts]:
+    if isinstance(histograms, PortfolioCounts):
+        return PortfolioCounts(total.completion.merge(histograms.completion), merge_histograms(total.teams, histograms.teams),
+                               total.critical + histograms.critical)
+    if isinstance(histograms, list):
+        return [total_histogram.merge(histogram) for total_histogram, histogram in zip(total, histograms)]
+
+    return total.merge(histograms)
+
+
+def how_many_counts(data: np.ndarray, amount_of_days: int, trials: int, rng: np.random.Generator,
+                    max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None) -> np.ndarray:
+    if amount_of_days <= 0:
+        return np.array([trials], dtype=np.int64)
+
+    chunk_trials: int = max(1, max_chunk_cells // amount_of_days)
+    counts: np.ndarray = np.zeros(0, dtype=np.int64)
+
+    for chunk_start in range(0, trials, chunk_trials):
+        chunk_size: int = min(chunk_trials, trials - chunk_start)
+        draws: np.ndarray = draw_days(rng, len(data), (chunk_size, amount_of_days), alias_table)
+        finished_items: np.ndarray = data[draws].sum(axis=1)
+        counts = add_counts(counts, np.bincount(finished_items))
+
+    return counts
+
+
+def when_counts(data: np.ndarray, remaining_items: int, trials: int, rng: np.random.Generator,
+                max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None) -> np.ndarray:
+    if remaining_items <= 0:
+        return np.array([trials], dtype=np.int64)
+
+    expected_throughput: float = mean_throughput(data, alias_table)
+    if expected_throughput == 0:
+        raise ValueError("No items were closed in the history window, the remaining items can never be finished")
+
+    # Draw a bit more than the expected number of days per block, trials that did
+    # not cross the remaining items yet simply get another block appended.
+    block_days: int = max(1, math.ceil(1.25 * remaining_items / expected_throughput))
+    chunk_trials: int = max(1, max_chunk_cells // block_days)
+    counts: np.ndarray = np.zeros(0, dtype=np.int64)
+
+    for chunk_start in range(0, trials, chunk_trials):
+        chunk_size: int = min(chunk_trials, trials - chunk_start)
+        finished_items: np.ndarray = np.zeros(chunk_size, dtype=np.int64)
+        days_done: int = 0
+        day_counts: List[np.ndarray] = []
+
+        while len(finished_items) > 0:
+            draws: np.ndarray = draw_days(rng, len(data), (len(finished_items), block_days), alias_table)
+            cumulative: np.ndarray = np.cumsum(data[draws], axis=1)
+            cumulative += finished_items[:, np.newaxis]
+
+            crossed: np.ndarray = cumulative[:, -1] >= remaining_items
+            crossing_day: np.ndarray = np.argmax(cumulative[crossed] >= remaining_items, axis=1)
+            day_counts.append(crossing_day + days_done + 1)
+
+            finished_items = cumulative[~crossed, -1]
+            days_done += block_days
+
+        counts = add_counts(counts, np.bincount(np.concatenate(day_counts)))
+
+    return counts
+
+
+# Trials are always split into shards of this size, and every shard gets its own
+# spawned seed. The shards, and therefore the merged histogram, do not depend on
+# the number of workers, so a seeded run is reproducible on any machine.
+DEFAULT_SHARD_TRIALS: int = 250_000
+
+
+def check_run(trials: int, workers: int) -> None:
+    if trials <= 0:
+        raise ValueError(f"The number of trials must be at least 1, got {trials}")
+    if workers <= 0:
+        raise ValueError(f"The number of workers must be at least 1, got {workers}")
+
+
+def shard_trials(trials: int, trials_per_shard: int = DEFAULT_SHARD_TRIALS) -> List[int]:
+    return [min(trials_per_shard, trials - shard_start) for shard_start in range(0, trials, trials_per_shard)]
+
+
+def run_shard(counts_function: Callable, data: np.ndarray, parameter: Any, trials: int, seed_sequence: np.random.SeedSequence,
+              max_chunk_cells: int, alias_table: Optional[AliasTable] = None) -> Union[Histogram, List[Histogram], PortfolioCounts]:
+    return to_histograms(counts_function(data, parameter, trials, np.random.default_rng(seed_sequence), max_chunk_cells, alias_table))
+
+
+def run_shards(executor: Optional[Executor], counts_function: Callable, data: np.ndarray, parameter: Any, shards: List[int],
+               seed_sequences: List[np.random.SeedSequence], max_chunk_cells: int, alias_table: Optional[AliasTable] = None) -> List:
+    if executor is None or len(shards) < 2:
+        return [run_shard(counts_function, data, parameter, shard_size, seed_sequence, max_chunk_cells, alias_table)
+                for shard_size, seed_sequence in zip(shards, seed_sequences)]
+
+    futures: List[Future] = [executor.submit(run_shard, counts_function, data, parameter, shard_size, seed_sequence, max_chunk_cells, alias_table)
+                             for shard_size, seed_sequence in zip(shards, seed_sequences)]
+    return [future.result() for future in futures]
+
+
+def run_sharded(counts_function: Callable, data: np.ndarray, parameter: Any, trials: int, seed: Optional[int] = None,
+                workers: int = 1, max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None,
+                trials_per_shard: int = DEFAULT_SHARD_TRIALS, executor: Optional[Executor] = None) -> Union[Histogram, List[Histogram], PortfolioCounts]:
+    check_run(trials, workers)
+    shards: List[int] = shard_trials(trials, trials_per_shard)
+    seed_sequences: List[np.random.SeedSequence] = np.random.SeedSequence(seed).spawn(len(shards))
+
+    # A caller that runs many simulations passes its own executor, otherwise a pool is started for this call
+    own_executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(max_workers=min(workers, len(shards))) \
+        if executor is None and workers > 1 and len(shards) > 1 else None
+    try:
+        shard_results: List = run_shards(executor or own_executor, counts_function, data, parameter, shards, seed_sequences, max_chunk_cells, alias_table)
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown()
+
+    histograms = shard_results[0]
+    for shard_histograms in shard_results[1:]:
+        histograms = merge_histograms(histograms, shard_histograms)
+
+    return histograms
+
+
+class Convergence(NamedTuple):
+    trials: int
+    # Half width of the confidence interval of each percentile, in items or days
+    precision: Dict[float, float]
+    converged: bool
+
+
+DEFAULT_BATCH_TRIALS: int = 20_000
+DEFAULT_MAX_TRIALS: int = 10_000_000
+DEFAULT_CONFIDENCE_Z: float = 1.96
+
+
+# Confidence interval of a quantile from the binomial distribution of the number
+# of samples below it: the ranks n*q -/+ z*sqrt(n*q*(1-q)) are mapped to values.
+def quantile_interval(counts: np.ndarray, quantile: float, z: float = DEFAULT_CONFIDENCE_Z) -> Tuple[int, int]:
+    cumulative: np.ndarray = np.cumsum(counts)
+    trials: int = int(cumulative[-1])
+    spread: float = z * math.sqrt(trials * quantile * (1 - quantile))
+    low_rank: float = max(trials * quantile - spread, 1)
+    high_rank: float = min(trials * quantile + spread, trials)
+
+    return int(np.searchsorted(cumulative, low_rank)), int(np.searchsorted(cumulative, high_rank))
+
+
+def percentile_precision(counts: np.ndarray, percentiles: Sequence[float], descending: bool, z: float = DEFAULT_CONFIDENCE_Z) -> Dict[float, float]:
+    precision: Dict[float, float] = {}
+
+    for percentile in percentiles:
+        low, high = quantile_interval(counts, 1 - percentile if descending else percentile, z)
+        precision[percentile] = (high - low) / 2
+
+    return precision
+
+
+# Runs batches until every percentile is within tolerance or max_trials is reached.
+# Batches are checked one by one in a fixed order, also when several of them were
+# computed in parallel, so the stopping point does not depend on the worker count.
+def run_adaptive(counts_function: Callable, data: np.ndarray, parameter: Any, percentiles: Sequence[float], descending: bool,
+                 tolerance: float, max_trials: int = DEFAULT_MAX_TRIALS, seed: Optional[int] = None, workers: int = 1,
+                 max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None,
+                 batch_trials: int = DEFAULT_BATCH_TRIALS, executor: Optional[Executor] = None) -> Tuple[Histogram, Convergence]:
+    check_run(max_trials, workers)
+    if batch_trials <= 0:
+        raise ValueError(f"The number of trials per batch must be at least 1, got {batch_trials}")
+    seed_sequence: np.random.SeedSequence = np.random.SeedSequence(seed)
+    histogram: Histogram = Histogram()
+    trials: int = 0
+    precision: Dict[float, float] = {}
+
+    own_executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(max_workers=workers) if executor is None and workers > 1 else None
+    try:
+        while trials < max_trials:
+            shards: List[int] = shard_trials(min(batch_trials * max(workers, 1), max_trials - trials), batch_trials)
+            batches: List[Histogram] = run_shards(executor or own_executor, counts_function, data, parameter, shards,
+                                                  seed_sequence.spawn(len(shards)), max_chunk_cells, alias_table)
+
+            for shard_size, batch in zip(shards, batches):
+                histogram.merge(batch)
+                trials += shard_size
+                precision = percentile_precision(histogram.counts, percentiles, descending)
+
+                if all(value <= tolerance for value in precision.values()):
+                    return histogram, Convergence(trials, precision, True)
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown(cancel_futures=True)
+
+    return histogram, Convergence(trials, precision, False)
+
+
+# Simulates cumulative throughput paths once for a whole grid of target horizons and
+# backlog sizes. Returns one how_many histogram per horizon followed by one when
+# histogram per backlog size; on-time likelihoods follow from the how_many histograms.
+def scenario_counts(data: np.ndarray, parameter: Tuple[List[int], List[int]], trials: int, rng: np.random.Generator,
+                    max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None) -> List[np.ndarray]:
+    horizons, remaining_items_list = parameter
+    max_horizon: int = max([0] + list(horizons))
+    max_remaining: int = max([0] + list(remaining_items_list))
+
+    expected_throughput: float = mean_throughput(data, alias_table)
+    if max_remaining > 0 and expected_throughput == 0:
+        raise ValueError("No items were closed in the history window, the remaining items can never be finished")
+
+    # The first block covers the farthest horizon, later blocks only extend the
+    # trials that did not finish the biggest backlog yet.
+    expected_days: int = math.ceil(1.25 * max_remaining / expected_throughput) if max_remaining > 0 else 0
+    first_block_days: int = max(1, max_horizon, expected_days)
+    next_block_days: int = max(1, expected_days)
+    chunk_trials: int = max(1, max_chunk_cells // first_block_days)
+
+    how_many: List[np.ndarray] = [np.zeros(0, dtype=np.int64) for _ in horizons]
+    when: List[np.ndarray] = [np.zeros(0, dtype=np.int64) for _ in remaining_items_list]
+
+    for chunk_start in range(0, trials, chunk_trials):
+        chunk_size: int = min(chunk_trials, trials - chunk_start)
+        crossing_days: np.ndarray = np.zeros((len(remaining_items_list), chunk_size), dtype=np.int64)
+        active: np.ndarray = np.arange(chunk_size)
+        finished_items: np.ndarray = np.zeros(chunk_size, dtype=np.int64)
+        days_done: int = 0
+        block_days: int = first_block_days
+
+        while len(active) > 0:
+            draws: np.ndarray = draw_days(rng, len(data), (len(active), block_days), alias_table)
+            cumulative: np.ndarray = np.cumsum(data[draws], axis=1)
+            cumulative += finished_items[:, np.newaxis]
+
+            if days_done == 0:
+                for index, horizon in enumerate(horizons):
+                    finished_at_horizon: np.ndarray = cumulative[:, horizon - 1] if horizon > 0 else np.zeros(chunk_size, dtype=np.int64)
+                    how_many[index] = add_counts(how_many[index], np.bincount(finished_at_horizon))
+
+            for index, remaining_items in enumerate(remaining_items_list):
+                if remaining_items <= 0:
+                    continue
+                crossed: np.ndarray = (crossing_days[index, active] == 0) & (cumulative[:, -1] >= remaining_items)
+                crossing_day: np.ndarray = np.argmax(cumulative[crossed] >= remaining_items, axis=1)
+                crossing_days[index, active[crossed]] = crossing_day + days_done + 1
+
+            still_running: np.ndarray = cumulative[:, -1] < max_remaining
+            active = active[still_running]
+            finished_items = cumulative[still_running, -1]
+            days_done += block_days
+            block_days = next_block_days
+
+        for index in range(len(remaining_items_list)):
+            when[index] = add_counts(when[index], np.bincount(crossing_days[index]))
+
+    return how_many + when
+
+
+def run_scenarios(monte_carlo_data: Sequence, horizons: List[int], remaining_items_list: List[int], trials: int,
+                  seed: Optional[int] = None, workers: int = 1, max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS,
+                  alias_table: Optional[AliasTable] = None, executor: Optional[Executor] = None) -> Tuple[List[Histogram], List[Histogram]]:
+    scale: int = throughput_scale(monte_carlo_data)
+    data: np.ndarray = as_throughput_array(monte_carlo_data, scale)
+    check_alias_table(data, alias_table)
+    histograms: List[Histogram] = run_sharded(scenario_counts, data, (list(horizons), [items * scale for items in remaining_items_list]), trials,
+                                              seed, workers, max_chunk_cells, alias_table, executor=executor)
+    return [floor_items(histogram, scale) for histogram in histograms[:len(horizons)]], histograms[len(horizons):]
+
+
+def run_how_many(monte_carlo_data: Sequence, amount_of_days: int, trials: int, seed: Optional[int] = None, workers: int = 1,
+                 max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None, executor: Optional[Executor] = None) -> Histogram:
+    scale: int = throughput_scale(monte_carlo_data)
+    data: np.ndarray = as_throughput_array(monte_carlo_data, scale)
+    check_alias_table(data, alias_table)
+    return floor_items(run_sharded(how_many_counts, data, amount_of_days, trials, seed, workers, max_chunk_cells, alias_table, executor=executor), scale)
+
+
+def run_when(monte_carlo_data: Sequence, remaining_items: int, trials: int, seed: Optional[int] = None, workers: int = 1,
+             max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None, executor: Optional[Executor] = None) -> Histogram:
+    scale: int = throughput_scale(monte_carlo_data)
+    data: np.ndarray = as_throughput_array(monte_carlo_data, scale)
+    check_alias_table(data, alias_table)
+    return run_sharded(when_counts, data, remaining_items * scale, trials, seed, workers, max_chunk_cells, alias_table, executor=executor)
+
+
+# The convergence check runs on the fixed-point scale, tolerance and precision are in items
+def run_how_many_adaptive(monte_carlo_data: Sequence, amount_of_days: int, percentiles: Sequence[float], tolerance: float,
+                          max_trials: int = DEFAULT_MAX_TRIALS, seed: Optional[int] = None, workers: int = 1,
+                          max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None, executor: Optional[Executor] = None) -> Tuple[Histogram, Convergence]:
+    scale: int = throughput_scale(monte_carlo_data)
+    data: np.ndarray = as_throughput_array(monte_carlo_data, scale)
+    check_alias_table(data, alias_table)
+    histogram, convergence = run_adaptive(how_many_counts, data, amount_of_days, percentiles, True, tolerance * scale, max_trials, seed, workers,
+                                          max_chunk_cells, alias_table, executor=executor)
+    precision: Dict[float, float] = {percentile: value / scale for percentile, value in convergence.precision.items()}
+    return floor_items(histogram, scale), convergence._replace(precision=precision)
+
+
+def run_when_adaptive(monte_carlo_data: Sequence, remaining_items: int, percentiles: Sequence[float], tolerance: float,
+                      max_trials: int = DEFAULT_MAX_TRIALS, seed: Optional[int] = None, workers: int = 1,
+                      max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None, executor: Optional[Executor] = None) -> Tuple[Histogram, Convergence]:
+    scale: int = throughput_scale(monte_carlo_data)
+    data: np.ndarray = as_throughput_array(monte_carlo_data, scale)
+    check_alias_table(data, alias_table)
+    return run_adaptive(when_counts, data, remaining_items * scale, percentiles, False, tolerance, max_trials, seed, workers, max_chunk_cells,
+                        alias_table, executor=executor)
+
+
+# Probabilities below this are treated as numerical noise of the FFT and dropped
+EXACT_PROBABILITY_FLOOR: float = 1e-12
+# The exact 'when' distribution is cut off once less than this much mass is left
+EXACT_TAIL_TOLERANCE: float = 1e-9
+# Below this length a direct convolution is both faster and exact
+FFT_MIN_LENGTH: int = 64
+# Every simulated day of the exact 'when' convolves a distribution of this many cells up
+# to the remaining items, beyond it sampling 100k trials is faster and the service runs
+# the numpy engine instead (fine fractional throughput, e.g. 0.001 story points steps)
+EXACT_MAX_WHEN_CELLS: int = 20_000
+
+
+# Weighted sampling only changes how likely every history day is, not the values
+def throughput_pmf(monte_carlo_data: Sequence, alias_table: Optional[AliasTable] = None, scale: int = 1) -> np.ndarray:
+    data: np.ndarray = as_throughput_array(monte_carlo_data, scale)
+    if alias_table is None:
+        return np.bincount(data) / len(data)
+
+    check_alias_table(data, alias_table)
+    return np.bincount(data, weights=alias_table.probabilities)
+
+
+def fft_convolve(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    if min(len(a), len(b)) < FFT_MIN_LENGTH:
+        return np.convolve(a, b)
+
+    size: int = len(a) + len(b) - 1
+    fft_size: int = 1 << (size - 1).bit_length()
+    result: np.ndarray = np.fft.irfft(np.fft.rfft(a, fft_size) * np.fft.rfft(b, fft_size), fft_size)[:size]
+    return np.clip(result, 0, None)
+
+
+def convolution_power(pmf: np.ndarray, power: int) -> np.ndarray:
+    result: np.ndarray = np.ones(1)
+    base: np.ndarray = pmf
+
+    while power > 0:
+        if power & 1:
+            result = fft_convolve(result, base)
+        power >>= 1
+        if power > 0:
+            base = fft_convolve(base, base)
+
+    return result
+
+
+# Expected counts for the given number of trials, so exact and sampled results compare directly
+def probabilities_to_histogram(probabilities: np.ndarray, trials: int) -> Histogram:
+    return Histogram(np.where(probabilities > EXACT_PROBABILITY_FLOOR, probabilities * trials, 0.0))
+
+
+def exact_how_many(monte_carlo_data: Sequence, amount_of_days: int, trials: int, alias_table: Optional[AliasTable] = None) -> Histogram:
+    if amount_of_days <= 0:
+        return Histogram([float(trials)])
+
+    scale: int = throughput_scale(monte_carlo_data)
+    distribution: np.ndarray = convolution_power(throughput_pmf(monte_carlo_data, alias_table, scale), amount_of_days)
+    return floor_items(probabilities_to_histogram(distribution / distribution.sum(), trials), scale)
+
+
+# The daily throughput and the remaining items on the coarsest integer grid that holds
+# both exactly: the fixed-point scale divided by the common divisor of all values, so
+# e.g. half story points count in halves. Only the day the remaining items are crossed
+# matters for 'when', which does not depend on the unit.
+def when_grid(monte_carlo_data: Sequence, remaining_items: int) -> Tuple[np.ndarray, int]:
+    scale: int = throughput_scale(monte_carlo_data)
+    data: np.ndarray = as_throughput_array(monte_carlo_data, scale)
+    divisor: int = max(int(np.gcd.reduce(np.append(data, remaining_items * scale))), 1)
+    return data // divisor, remaining_items * scale // divisor
+
+
+def exact_when_supported(monte_carlo_data: Sequence, remaining_items: int) -> bool:
+    return remaining_items <= 0 or when_grid(monte_carlo_data, remaining_items)[1] <= EXACT_MAX_WHEN_CELLS
+
+
+def exact_when(monte_carlo_data: Sequence, remaining_items: int, trials: int,
+               tail_tolerance: float = EXACT_TAIL_TOLERANCE, alias_table: Optional[AliasTable] = None) -> Histogram:
+    if remaining_items <= 0:
+        return Histogram([float(trials)])
+
+    data, remaining_cells = when_grid(monte_carlo_data, remaining_items)
+    pmf: np.ndarray = throughput_pmf(data, alias_table)
+    if pmf[0] == 1:
+        raise ValueError("No items were closed in the history window, the remaining items can never be finished")
+
+    return probabilities_to_histogram(first_passage_probabilities(pmf, remaining_cells, tail_tolerance), trials)
+
+
+# Probability per day that the remaining items are finished on exactly that day
+def first_passage_probabilities(pmf: np.ndarray, remaining_items: int, tail_tolerance: float = EXACT_TAIL_TOLERANCE) -> np.ndarray:
+    # Distribution of finished items over the trials that did not reach the
+    # remaining items yet; whatever mass leaves it on a day crossed on that day.
+    not_finished: np.ndarray = np.zeros(remaining_items)
+    not_finished[0] = 1.0
+    mass_left: float = 1.0
+    first_passage: List[float] = [0.0]
+
+    while mass_left > tail_tolerance:
+        not_finished = fft_convolve(not_finished, pmf)[:remaining_items]
+        new_mass_left: float = float(not_finished.sum())
+        first_passage.append(max(mass_left - new_mass_left, 0.0))
+        mass_left = new_mass_left
+
+    return np.asarray(first_passage)
+
+
+# Correlated portfolio trials sum up this share of every team's expected days in one go
+# before stepping it day by day. Trials that finish that early are resolved afterwards.
+PORTFOLIO_PREFIX_SHARE: float = 0.7
+
+
+# Independent teams finish independently of each other, so every team's completion day
+# is drawn from its exact first passage distribution by inverse transform sampling
+# instead of simulating its daily throughput.
+def independent_done_days(data: np.ndarray, remaining: np.ndarray, trials: int, rng: np.random.Generator,
+                          alias_table: Optional[AliasTable] = None) -> np.ndarray:
+    done_day: np.ndarray = np.zeros((len(remaining), trials), dtype=np.int64)
+
+    for team in np.flatnonzero(remaining > 0):
+        cumulative: np.ndarray = np.cumsum(first_passage_probabilities(throughput_pmf(data[team], alias_table), int(remaining[team])))
+        done_day[team] = np.searchsorted(cumulative, rng.random(trials) * cumulative[-1], side='right')
+
+    return done_day
+
+
+# Correlated teams share the drawn history day, every team walks through the same draws
+def correlated_done_days(data: np.ndarray, remaining: np.ndarray, trials: int, rng: np.random.Generator,
+                         alias_table: Optional[AliasTable] = None) -> np.ndarray:
+    history_days: int = data.shape[1]
+    done_day: np.ndarray = np.zeros((len(remaining), trials), dtype=np.int64)
+    working_teams: np.ndarray = np.flatnonzero(remaining > 0)
+    expected_days: np.ndarray = remaining[working_teams] / np.array([mean_throughput(data[team], alias_table) for team in working_teams])
+
+    # One row of draws per day, so a day of all trials is one contiguous gather
+    draw_type: type = np.uint8 if history_days <= 256 else np.int64
+    draws: np.ndarray = draw_days(rng, history_days, (math.ceil(1.25 * expected_days.max()), trials), alias_table, draw_type)
+
+    for team, team_expected_days in zip(working_teams, expected_days):
+        # Daily throughput fits int32 easily, halving the memory traffic of the gathers
+        throughput: np.ndarray = data[team].astype(np.int32)
+        prefix: int = int(PORTFOLIO_PREFIX_SHARE * team_expected_days)
+        prefix_items: np.ndarray = throughput.take(draws[:prefix]).sum(axis=0, dtype=np.int64)
+        finished: np.ndarray = prefix_items >= remaining[team]
+
+        early: np.ndarray = np.flatnonzero(finished)
+        if len(early) > 0:
+            cumulative: np.ndarray = np.cumsum(throughput.take(draws[:prefix, early]), axis=0)
+            done_day[team, early] = np.argmax(cumulative >= remaining[team], axis=0) + 1
+
+        # Finished trials keep being stepped, but stop counting days, until half of the
+        # stepped trials are finished and they are dropped
+        rows: np.ndarray = np.flatnonzero(~finished)
+        finished_items: np.ndarray = prefix_items[rows]
+        stepped_days: np.ndarray = np.zeros(len(rows), dtype=np.int64)
+        day: int = prefix
+
+        while len(rows) > 0:
+            if day == len(draws):
+                draws = np.vstack([draws, draw_days(rng, history_days, (max(1, len(draws) // 4), trials), alias_table, draw_type)])
+            finished_items += throughput.take(draws[day].take(rows))
+            day += 1
+
+            running: np.ndarray = finished_items < remaining[team]
+            stepped_days += running
+            running_count: int = int(np.count_nonzero(running))
+            if running_count <= len(rows) // 2:
+                done_day[team, rows[~running]] = stepped_days[~running] + prefix + 1
+                rows, finished_items, stepped_days = rows[running], finished_items[running], stepped_days[running]
+
+    return done_day
+
+
+# Completion days of several teams that work off their own backlogs from the same start
+# date. data holds one throughput window per team (teams x days) covering the same
+# calendar days, so correlated sampling can draw the same history day for all teams: a
+# slow day (holidays, incidents) then slows everybody down together. Returns the
+# portfolio counts (the day the last team finishes), the counts per team and per team
+# the number of trials in which it finished last (tied teams all count).
+def portfolio_counts(data: np.ndarray, parameter: Tuple[List[int], bool], trials: int, rng: np.random.Generator,
+                     max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS, alias_table: Optional[AliasTable] = None) -> PortfolioCounts:
+    remaining_items_list, correlated = parameter
+    remaining: np.ndarray = np.asarray(remaining_items_list, dtype=np.int64)
+    teams: int = len(remaining)
+    working_teams: np.ndarray = np.flatnonzero(remaining > 0)
+    expected_throughput: np.ndarray = np.array([mean_throughput(data[team], alias_table) for team in working_teams])
+
+    if np.any(expected_throughput == 0):
+        raise ValueError("A team with remaining items closed no items in the history window, the portfolio can never be finished")
+
+    # Chunks hold the completion day per team and, correlated, the shared draws of every trial
+    expected_days: int = max([0] + [math.ceil(items / throughput) for items, throughput in zip(remaining[working_teams], expected_throughput)])
+    chunk_cells: int = teams + (expected_days if correlated else 0)
+    chunk_trials: int = max(1, max_chunk_cells // max(chunk_cells, 1))
+
+    portfolio: np.ndarray = np.zeros(0, dtype=np.int64)
+    team_counts: List[np.ndarray] = [np.zeros(0, dtype=np.int64) for _ in range(teams)]
+    critical: np.ndarray = np.zeros(teams, dtype=np.int64)
+
+    for chunk_start in range(0, trials, chunk_trials):
+        chunk_size: int = min(chunk_trials, trials - chunk_start)
+        if len(working_teams) == 0:
+            done_day: np.ndarray = np.zeros((teams, chunk_size), dtype=np.int64)
+        elif correlated:
+            done_day = correlated_done_days(data, remaining, chunk_size, rng, alias_table)
+        else:
+            done_day = independent_done_days(data, remaining, chunk_size, rng, alias_table)
+
+        completion: np.ndarray = done_day.max(axis=0)
+        portfolio = add_counts(portfolio, np.bincount(completion))
+        for team in range(teams):
+            team_counts[team] = add_counts(team_counts[team], np.bincount(done_day[team]))
+        critical += (done_day == completion).sum(axis=1)
+
+    return PortfolioCounts(portfolio, team_counts, critical)
+
+
+class Portfolio(NamedTuple):
+    # Day on which the last team finishes
+    completion: Histogram
+    teams: List[Histogram]
+    # Share of the trials in which each team finished last, tied teams all count
+    critical: List[float]
+
+
+def run_portfolio(team_data: Sequence[Sequence], remaining_items_list: Sequence[int], trials: int, correlated: bool = False,
+                  seed: Optional[int] = None, workers: int = 1, max_chunk_cells: int = DEFAULT_MAX_CHUNK_CELLS,
+                  alias_table: Optional[AliasTable] = None, executor: Optional[Executor] = None) -> Portfolio:
+    # One fixed-point scale for all teams, so they all count in the same unit
+    scale: int = max([throughput_scale(monte_carlo_data) for monte_carlo_data in team_data] + [1])
+    windows: List[np.ndarray] = [as_throughput_array(monte_carlo_data, scale) for monte_carlo_data in team_data]
+    if len(windows) != len(remaining_items_list):
+        raise ValueError("Every team needs its remaining items")
+    if len({len(window) for window in windows}) != 1:
+        raise ValueError("The throughput windows of all teams must cover the same days")
+    check_alias_table(windows[0], alias_table)
+
+    counts: PortfolioCounts = run_sharded(portfolio_counts, np.vstack(windows), ([items * scale for items in remaining_items_list], correlated),
+                                          trials, seed, workers, max_chunk_cells, alias_table, executor=executor)
+    return Portfolio(counts.completion, counts.teams, [float(critical) / trials for critical in counts.critical])
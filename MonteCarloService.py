@@ -1,29 +1,139 @@
+import math
 import os
 import random
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import date, timedelta
-import matplotlib.pyplot as plt
-import pandas as pd
-from typing import List, Tuple, Dict, Optional
+import numpy as np
+from typing import List, Tuple, Dict, Optional, Sequence, Union, TYPE_CHECKING
+
+import MonteCarloEngine
+from AliasTable import AliasTable
+from ChartRenderer import ChartRenderer
+from DailyThroughput import DailyThroughput
+from Histogram import Histogram
+from Profiler import PROFILER
+from SamplingStrategy import SamplingStrategy
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from HistoryStore import HistoryStore
+
+# pandas is only imported where a DataFrame is built, the simulations work on a
+# DailyThroughput, which can also be read from a csv without pandas
+ClosedItemsHistory = Union["pd.DataFrame", DailyThroughput]
+
+DEFAULT_PERCENTILES: Tuple[float, ...] = (0.5, 0.7, 0.85, 0.95)
+# Colors of the percentile lines in the charts, repeated for longer percentile lists
+PERCENTILE_COLORS: Tuple[str, ...] = ("red", "orange", "lightgreen", "darkgreen")
+
+
+# 0.5 -> "50%", 0.975 -> "97.5%"
+def percentile_label(percentile: float, unit: str = "%") -> str:
+    return f"{round(percentile * 100, 6):g}{unit}"
+
 
 class MonteCarloService:
     
-    def __init__(self, history_in_days: int, save_charts: bool = False, trials: int = 100000) -> None:
+    ENGINES: Tuple[str, ...] = ("numpy", "exact", "python")
+
+    def __init__(self, history_in_days: int, save_charts: bool = False, trials: int = 100000, engine: str = "numpy",
+                 max_chunk_cells: int = MonteCarloEngine.DEFAULT_MAX_CHUNK_CELLS, seed: Optional[int] = None, workers: int = 1,
+                 adaptive: bool = False, tolerance: float = 1.0, max_trials: int = MonteCarloEngine.DEFAULT_MAX_TRIALS,
+                 chart_format: str = "png", percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+                 sampling: Optional[SamplingStrategy] = None, executor: Optional[Executor] = None) -> None:
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {', '.join(self.ENGINES)}")
+        if adaptive and engine != "numpy":
+            raise ValueError("Adaptive trial counts are only supported by the numpy engine")
+        if not percentiles or any(not 0 < percentile < 1 for percentile in percentiles):
+            raise ValueError("Percentiles must be between 0 and 1 (exclusive)")
+        if history_in_days <= 0:
+            raise ValueError(f"The history must cover at least one day, got {history_in_days}")
+        if trials <= 0:
+            raise ValueError(f"The number of trials must be at least 1, got {trials}")
+        if adaptive and max_trials <= 0:
+            raise ValueError(f"The maximum number of trials must be at least 1, got {max_trials}")
+        # 0 workers uses all cores
+        if workers < 0:
+            raise ValueError(f"The number of workers must not be negative, got {workers}")
+
         self.trials: int = trials        
         self.history_in_days: int = history_in_days
+        self.engine: str = engine
+        self.max_chunk_cells: int = max_chunk_cells
+        # Every simulation starts from the same seed, so a seeded service returns the
+        # same results for the same inputs, independent of the number of workers.
+        self.seed: Optional[int] = seed
+        self.workers: int = workers if workers > 0 else (os.cpu_count() or 1)
+        # With more than one worker the process pool is started on first use and kept
+        # until close(), so every forecast does not pay for starting the processes. A
+        # pool passed in is shared, e.g. by the services of the forecast server, and is
+        # left running on close().
+        self.__executor: Optional[Executor] = executor
+        self.__owns_executor: bool = executor is None
+
+        # In adaptive mode trials run in batches until every percentile is stable within
+        # tolerance (items for how_many, days for when) or max_trials is reached.
+        # The trials used and the achieved precision of the last run end up in last_convergence.
+        self.adaptive: bool = adaptive
+        self.tolerance: float = tolerance
+        self.max_trials: int = max_trials
+        self.last_convergence: Optional[MonteCarloEngine.Convergence] = None
+
+        # Prepared throughput is cached per history DataFrame, the DataFrame itself is
+        # kept alongside so its id() can not be reused while the entry is alive.
+        # Mutating a DataFrame after it was used for a forecast is not detected.
+        self.__throughput_index_cache: Dict[int, Tuple[ClosedItemsHistory, DailyThroughput]] = {}
+        self.__throughput_window_cache: Dict[Tuple[int, date, int], np.ndarray] = {}
+        self.__sampling_cache: Dict[Tuple[int, date, int], Tuple[np.ndarray, Optional[AliasTable]]] = {}
+        
+        # How history days are drawn, and with the weekday strategy which days are worked
+        self.sampling: SamplingStrategy = sampling or SamplingStrategy()
         
-        self.percentile_50: float = 0.5
-        self.percentile_70: float = 0.7
-        self.percentile_85: float = 0.85
-        self.percentile_95: float = 0.95
+        # how_many and when return one prediction per percentile, in this order
+        self.percentiles: List[float] = list(percentiles)
 
         script_path: str = os.path.dirname(os.path.abspath(__file__))
         self.charts_folder: str = os.path.join(script_path, 'Charts')
         self.save_charts: bool = save_charts
+        self.chart_renderer: Optional[ChartRenderer] = ChartRenderer(self.charts_folder, chart_format) if save_charts else None
+
+    # A copy sent to a worker process, e.g. by the backtest, starts with empty caches and renders no charts
+    def __getstate__(self) -> Dict:
+        state: Dict = {key: {} if key.endswith("_cache") else value for key, value in self.__dict__.items()}
+        state.update(save_charts=False, chart_renderer=None, _MonteCarloService__executor=None, _MonteCarloService__owns_executor=True)
+        return state
+
+    # Blocks until all charts are written and stops the worker processes, call it before the process exits
+    def close(self) -> None:
+        if self.chart_renderer is not None:
+            self.chart_renderer.close()
+        if self.__executor is not None and self.__owns_executor:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    # The same service with other trials and seed. It shares the prepared throughput,
+    # windows, sampling tables and process pool of this one, so e.g. every request of
+    # the forecast server gets its own settings without preparing the history again.
+    # Closing the variant leaves the shared pool running.
+    def variant(self, trials: int, seed: Optional[int]) -> "MonteCarloService":
+        if trials <= 0:
+            raise ValueError(f"The number of trials must be at least 1, got {trials}")
 
-        if save_charts and not os.path.exists(self.charts_folder):
-            os.makedirs(self.charts_folder)
+        variant: MonteCarloService = MonteCarloService.__new__(MonteCarloService)
+        variant.__dict__.update(self.__dict__)
+        variant.trials, variant.seed, variant.last_convergence = trials, seed, None
+        variant.__executor, variant.__owns_executor = self.__get_executor(), False
+        return variant
+
+    def __get_executor(self) -> Optional[Executor]:
+        if self.workers > 1 and self.__executor is None:
+            self.__executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self.__executor
         
     def create_closed_items_history(self, items: List) -> Dict:
+        import pandas as pd
+
         print(f"Getting items that were done in the last {self.history_in_days} days...")       
         time_delta: date = date.today() - timedelta(self.history_in_days)
         df: pd.DataFrame = pd.DataFrame.from_records([item.to_dict() for item in items])        
@@ -33,33 +143,141 @@ class MonteCarloService:
         
         closed_items_hist: Dict = {}
         
-        if self.save_charts:
-            tp_run_chart_path: str = os.path.join(self.charts_folder, 'Throughput_Run_Chart.png')
-            print(f"Storing Chart at {tp_run_chart_path}")
-            plt.bar(list(closed_items_hist.keys()), closed_items_hist.values(), color='b')
-            plt.savefig(tp_run_chart_path)
+        if self.chart_renderer is not None:
+            self.chart_renderer.render_throughput(closed_items_hist)
         
         print(f"Found {len(closed_items)} items that were closed in the last {self.history_in_days} days")
                     
         return closed_items_hist
     
-    def how_many(self, start_date: date, target_date: date, closed_items_history: Dict, title: str = "How Many {item_type} will be done till {target_date}") -> Tuple:
-        monte_carlo_simulation_results: Dict = self.__run_monte_carlo_how_many(start_date, target_date, closed_items_history)
+    # Loads only the date and items columns of the issues inside the history window
+    def read_closed_items_history(self, history_store: "HistoryStore", start_date: date, items_column: str = 'Story Points') -> "pd.DataFrame":
+        first_day: date = start_date - timedelta(self.history_in_days - 1)
+        closed_items_hist: pd.DataFrame = history_store.read([history_store.DATE_COLUMN, items_column], first_day, start_date)
+        return closed_items_hist.rename(columns={history_store.DATE_COLUMN: 'Done Date', items_column: 'Items'})
+
+    def how_many(self, start_date: date, target_date: date, closed_items_history: ClosedItemsHistory, title: str = "How Many {item_type} will be done till {target_date}") -> Tuple:
+        monte_carlo_simulation_results: Histogram = self.__run_monte_carlo_how_many(start_date, target_date, closed_items_history)
         
-        return self.__get_predictions_howmany(monte_carlo_simulation_results, title)
+        with PROFILER.stage("monte_carlo.percentiles"):
+            return self.__get_predictions_howmany(monte_carlo_simulation_results, title)
         
-    def when(self, remaining_items: int, closed_items_history: Dict, start_date: date, target_date: Optional[date] = None, title: str = "When will {items_name} be done ?") -> Tuple:
-        monte_carlo_simulation_results: Dict = self.__run_monte_carlo_when(start_date, remaining_items, closed_items_history)
+    def when(self, remaining_items: int, closed_items_history: ClosedItemsHistory, start_date: date, target_date: Optional[date] = None, title: str = "When will {items_name} be done ?") -> Tuple:
+        monte_carlo_simulation_results: Histogram = self.__run_monte_carlo_when(start_date, remaining_items, closed_items_history)
         
-        days_to_target_date: Optional[int] = (target_date - date.today()).days if target_date else None
+        days_to_target_date: Optional[int] = self.sampling.days_between(start_date, target_date) if target_date else None
         
-        return self.__get_predictions_when(monte_carlo_simulation_results, start_date, days_to_target_date, title)
+        with PROFILER.stage("monte_carlo.percentiles"):
+            return self.__get_predictions_when(monte_carlo_simulation_results, start_date, days_to_target_date, title)
 
-    def __run_monte_carlo_when(self, start_date: date, remaining_items: int, closed_items_history: Dict) -> Dict:        
-        time_delta: date = start_date - timedelta(self.history_in_days)
-        monte_carlo_data: List[int] = self.__prepare_monte_carlo_dataset(start_date, time_delta, closed_items_history)            
-                
-        mc_results: Dict[int, int] = {}
+    # The simulated outcomes behind how_many and when, in items and simulated days, e.g. to score them against what happened
+    def how_many_distribution(self, start_date: date, target_date: date, closed_items_history: ClosedItemsHistory) -> Histogram:
+        return self.__run_monte_carlo_how_many(start_date, target_date, closed_items_history)
+
+    def when_distribution(self, start_date: date, remaining_items: int, closed_items_history: ClosedItemsHistory) -> Histogram:
+        return self.__run_monte_carlo_when(start_date, remaining_items, closed_items_history)
+
+    # Answers every (target date, remaining items) combination from one set of simulated
+    # throughput paths. Always samples with the numpy engine.
+    def scenarios(self, start_date: date, target_dates: List[date], remaining_items_list: List[int], closed_items_history: ClosedItemsHistory) -> "pd.DataFrame":
+        monte_carlo_data, alias_table = self.__prepare_sampling(start_date, closed_items_history)
+        horizons: List[int] = [self.sampling.days_between(start_date, target_date) for target_date in target_dates]
+
+        with PROFILER.stage("monte_carlo.scenarios") as stage:
+            how_many_counts, when_counts = MonteCarloEngine.run_scenarios(monte_carlo_data, horizons, remaining_items_list, self.trials,
+                                                                          self.seed, self.workers, self.max_chunk_cells, alias_table,
+                                                                          executor=self.__get_executor())
+            stage.add(trials=self.trials)
+
+        rows: List[Dict] = []
+        for target_date, how_many in zip(target_dates, how_many_counts):
+            how_many_percentiles: List[int] = how_many.quantiles(self.percentiles, descending=True)
+
+            for remaining_items, when in zip(remaining_items_list, when_counts):
+                when_percentiles: List[int] = when.quantiles(self.percentiles)
+
+                row: Dict = {"Target Date": target_date, "Remaining Items": remaining_items}
+                for percentile, value in zip(self.percentiles, how_many_percentiles):
+                    row[f"How Many {percentile_label(percentile)}"] = value
+                for percentile, days in zip(self.percentiles, when_percentiles):
+                    row[f"When {percentile_label(percentile)}"] = self.sampling.date_after(start_date, days)
+                row["On Time Likelihood"] = 100 * how_many.probability_at_least(remaining_items)
+                rows.append(row)
+
+        import pandas as pd
+
+        return pd.DataFrame.from_records(rows)
+
+    # Forecasts several teams that work off their own backlogs from start_date at the same
+    # time, the portfolio is done when the last team is done. With correlated sampling all
+    # teams get the same history day, so their history windows must cover the same days.
+    # Returns a portfolio row and a row per team. Always samples with the numpy engine;
+    # the values strategy draws days uniformly here, which is the same distribution.
+    def portfolio(self, start_date: date, team_histories: List[ClosedItemsHistory], remaining_items_list: List[int],
+                  team_names: Optional[List[str]] = None, target_date: Optional[date] = None, correlated: bool = False,
+                  title: str = "When will the portfolio be done ?") -> "pd.DataFrame":
+        team_names = team_names or [f"Team {index + 1}" for index in range(len(team_histories))]
+        if len(team_names) != len(team_histories):
+            raise ValueError("Every team needs a name")
+
+        monte_carlo_data: List[np.ndarray] = [self.__prepare_monte_carlo_dataset(start_date, closed_items_history) for closed_items_history in team_histories]
+        # Teams share the calendar, so the day weights are the same for all of them
+        day_weights: Optional[np.ndarray] = self.sampling.day_weights(start_date, self.history_in_days)
+        alias_table: Optional[AliasTable] = AliasTable(day_weights) if day_weights is not None else None
+
+        with PROFILER.stage("monte_carlo.portfolio") as stage:
+            portfolio: MonteCarloEngine.Portfolio = MonteCarloEngine.run_portfolio(monte_carlo_data, remaining_items_list, self.trials, correlated,
+                                                                                   self.seed, self.workers, self.max_chunk_cells, alias_table,
+                                                                                   executor=self.__get_executor())
+            stage.add(trials=self.trials)
+
+        days_to_target_date: Optional[int] = self.sampling.days_between(start_date, target_date) if target_date else None
+        # The portfolio row renders the chart, the team rows only need their percentiles
+        *portfolio_dates, portfolio_likelihood = self.__get_predictions_when(portfolio.completion, start_date, days_to_target_date, title)
+
+        rows: List[Dict] = [{"Team": "Portfolio", "Remaining Items": sum(remaining_items_list),
+                             **{f"When {percentile_label(percentile)}": predicted_date for percentile, predicted_date in zip(self.percentiles, portfolio_dates)},
+                             "On Time Likelihood": portfolio_likelihood, "Critical Likelihood": None}]
+        for team_name, remaining_items, when, critical in zip(team_names, remaining_items_list, portfolio.teams, portfolio.critical):
+            row: Dict = {"Team": team_name, "Remaining Items": remaining_items}
+            for percentile, days in zip(self.percentiles, when.quantiles(self.percentiles)):
+                row[f"When {percentile_label(percentile)}"] = self.sampling.date_after(start_date, days)
+            row["On Time Likelihood"] = 100 * when.probability_at_most(days_to_target_date) if days_to_target_date else 0
+            row["Critical Likelihood"] = 100 * critical
+            rows.append(row)
+
+        import pandas as pd
+
+        return pd.DataFrame.from_records(rows)
+
+    def __run_monte_carlo_when(self, start_date: date, remaining_items: int, closed_items_history: ClosedItemsHistory) -> Histogram:
+        monte_carlo_data, alias_table = self.__prepare_sampling(start_date, closed_items_history)
+
+        with PROFILER.stage(f"monte_carlo.when.{self.engine}") as stage:
+            mc_results: Histogram = self.__simulate_when(monte_carlo_data, remaining_items, alias_table)
+            if self.engine != "exact":
+                stage.add(trials=self.last_convergence.trials if self.adaptive else self.trials)
+        return mc_results
+
+    def __simulate_when(self, monte_carlo_data: np.ndarray, remaining_items: int, alias_table: Optional[AliasTable]) -> Histogram:
+        if self.adaptive:
+            mc_results, self.last_convergence = MonteCarloEngine.run_when_adaptive(monte_carlo_data, remaining_items, self.percentiles, self.tolerance,
+                                                                                   self.max_trials, self.seed, self.workers, self.max_chunk_cells, alias_table,
+                                                                                   executor=self.__get_executor())
+            return mc_results
+        if self.engine == "exact" and MonteCarloEngine.exact_when_supported(monte_carlo_data, remaining_items):
+            return MonteCarloEngine.exact_when(monte_carlo_data, remaining_items, self.trials, alias_table=alias_table)
+        # The exact engine samples too, when fine fractional throughput makes the exact distribution slower than sampling
+        if self.engine in ("numpy", "exact"):
+            return MonteCarloEngine.run_when(monte_carlo_data, remaining_items, self.trials, self.seed, self.workers, self.max_chunk_cells, alias_table,
+                                             executor=self.__get_executor())
+
+        return self.__simulate_when_python(monte_carlo_data, remaining_items, alias_table)
+
+    # Reference implementation, kept to cross-check the vectorized engine
+    def __simulate_when_python(self, monte_carlo_data: np.ndarray, remaining_items: int, alias_table: Optional[AliasTable]) -> Histogram:
+        mc_results: Histogram = Histogram()
+        rng: random.Random = random.Random(self.seed)
                 
         for i in range(self.trials):
             day_count: int = 0
@@ -67,87 +285,58 @@ class MonteCarloService:
                     
             while finished_item_count < remaining_items:
                 day_count += 1
-                rand: int = random.randint(0, len(monte_carlo_data) - 1)
+                rand: int = rng.randint(0, len(monte_carlo_data) - 1) if alias_table is None else alias_table.sample(rng)
                 finished_item_count += monte_carlo_data[rand]
                         
-            if day_count in mc_results:
-                mc_results[day_count] += 1
-            else:
-                mc_results[day_count] = 1
+            mc_results.increment(day_count)
                 
         return mc_results
 
-    def __get_predictions_when(self, mc_results: Dict, start_date: date, days_to_target_date: Optional[int] = None, title: str = "") -> Tuple:        
-        sorted_dict: Dict = {k: v for k, v in sorted(mc_results.items())}
-                
-        percentile_50_target: int = self.trials * 0.5
-        percentile_70_target: int = self.trials * 0.7
-        percentile_85_target: int = self.trials * 0.85
-        percentile_95_target: int = self.trials * 0.95
-
-        percentile_50: int = 0
-        percentile_70: int = 0
-        percentile_85: int = 0
-        percentile_95: int = 0
-        
-        trials_in_time: int = self.trials if days_to_target_date else -1
-        
-        count: int = 0
-                    
-        for key, value in sorted_dict.items():
-            count += value
-                    
-            if percentile_50 == 0 and count >= percentile_50_target:
-                percentile_50 = key
-            elif percentile_70 == 0 and count >= percentile_70_target:
-                percentile_70 = key
-            elif percentile_85 == 0 and count >= percentile_85_target:
-                percentile_85 = key
-            elif percentile_95 == 0 and count >= percentile_95_target:
-                percentile_95 = key
-                
-            if trials_in_time == self.trials and key >= days_to_target_date:
-                trials_in_time = count
-                
-        predicted_date_50: date = start_date + timedelta(percentile_50)
-        predicted_date_70: date = start_date + timedelta(percentile_70)
-        predicted_date_85: date = start_date + timedelta(percentile_85)
-        predicted_date_95: date = start_date + timedelta(percentile_95)    
-        
+    def __get_predictions_when(self, mc_results: Histogram, start_date: date, days_to_target_date: Optional[int] = None, title: str = "") -> Tuple:
+        days: List[int] = mc_results.quantiles(self.percentiles)
+        predicted_dates: List[date] = [self.sampling.date_after(start_date, day) for day in days]
+
         prediction_targetdate: float = 0
         if days_to_target_date:
-            prediction_targetdate = (100 / self.trials) * trials_in_time
-        
-        if self.save_charts:
+            prediction_targetdate = 100 * mc_results.probability_at_most(days_to_target_date)
+
+        if self.chart_renderer is not None:
             vertical_lines_data: List[Tuple[int, str, str, date]] = [
-                (percentile_50, '50th Percentile', "red", predicted_date_50),
-                (percentile_70, '70th Percentile', "orange", predicted_date_70),
-                (percentile_85, '85th Percentile', "lightgreen", predicted_date_85),
-                (percentile_95, '95th Percentile', "darkgreen", predicted_date_95)
-            ] 
-            
-            plt.figure(figsize=(15, 9))
-            when_chart_path: str = os.path.join(self.charts_folder, 'MC_When.png')
-            print(f"Storing Chart at {when_chart_path}")
-            plt.bar(list(sorted_dict.keys()), sorted_dict.values(), color='g')
-
-            for position, line_name, color, ddate in vertical_lines_data:
-                plt.axvline(x=position, color=color, linestyle='--', label=f"{line_name} ({position} days) -> {ddate}")
-
-            plt.legend()
-            plt.title(title)
-
-            plt.savefig(when_chart_path)
-            plt.show()
-
-        return (predicted_date_50, predicted_date_70, predicted_date_85, predicted_date_95, prediction_targetdate)
-
-    def __run_monte_carlo_how_many(self, start_date: date, prediction_date: date, closed_items_hist: Dict) -> Dict:
-        time_delta: date = start_date - timedelta(self.history_in_days)
-        monte_carlo_data: List[int] = self.__prepare_monte_carlo_dataset(start_date, time_delta, closed_items_hist)            
-                
-        mc_results: Dict[int, int] = {}
-        amount_of_days: int = (prediction_date - start_date).days
+                (day, f"{percentile_label(percentile, '')}th Percentile", PERCENTILE_COLORS[index % len(PERCENTILE_COLORS)], predicted_date)
+                for index, (percentile, day, predicted_date) in enumerate(zip(self.percentiles, days, predicted_dates))
+            ]
+            self.chart_renderer.render_when(mc_results.to_dict(), vertical_lines_data, title)
+
+        return (*predicted_dates, prediction_targetdate)
+
+    def __run_monte_carlo_how_many(self, start_date: date, prediction_date: date, closed_items_hist: ClosedItemsHistory) -> Histogram:
+        monte_carlo_data, alias_table = self.__prepare_sampling(start_date, closed_items_hist)
+        amount_of_days: int = self.sampling.days_between(start_date, prediction_date)
+
+        with PROFILER.stage(f"monte_carlo.how_many.{self.engine}") as stage:
+            mc_results: Histogram = self.__simulate_how_many(monte_carlo_data, amount_of_days, alias_table)
+            if self.engine != "exact":
+                stage.add(trials=self.last_convergence.trials if self.adaptive else self.trials)
+        return mc_results
+
+    def __simulate_how_many(self, monte_carlo_data: np.ndarray, amount_of_days: int, alias_table: Optional[AliasTable]) -> Histogram:
+        if self.adaptive:
+            mc_results, self.last_convergence = MonteCarloEngine.run_how_many_adaptive(monte_carlo_data, amount_of_days, self.percentiles, self.tolerance,
+                                                                                       self.max_trials, self.seed, self.workers, self.max_chunk_cells, alias_table,
+                                                                                       executor=self.__get_executor())
+            return mc_results
+        if self.engine == "numpy":
+            return MonteCarloEngine.run_how_many(monte_carlo_data, amount_of_days, self.trials, self.seed, self.workers, self.max_chunk_cells, alias_table,
+                                                 executor=self.__get_executor())
+        if self.engine == "exact":
+            return MonteCarloEngine.exact_how_many(monte_carlo_data, amount_of_days, self.trials, alias_table)
+
+        return self.__simulate_how_many_python(monte_carlo_data, amount_of_days, alias_table)
+
+    # Reference implementation, kept to cross-check the vectorized engine
+    def __simulate_how_many_python(self, monte_carlo_data: np.ndarray, amount_of_days: int, alias_table: Optional[AliasTable]) -> Histogram:
+        mc_results: Histogram = Histogram()
+        rng: random.Random = random.Random(self.seed)
                 
         for i in range(self.trials):
             day_count: int = 0
@@ -155,72 +344,52 @@ class MonteCarloService:
                     
             while day_count < amount_of_days:
                 day_count += 1
-                rand: int = random.randint(0, len(monte_carlo_data) - 1)
+                rand: int = rng.randint(0, len(monte_carlo_data) - 1) if alias_table is None else alias_table.sample(rng)
                 finished_item_count += monte_carlo_data[rand]
                         
-            if finished_item_count in mc_results:
-                mc_results[finished_item_count] += 1
-            else:
-                mc_results[finished_item_count] = 1
+            # Fractional items are only possible here, a partly finished item does not count
+            mc_results.increment(math.floor(finished_item_count))
                 
         return mc_results
 
-    def __get_predictions_howmany(self, mc_results: Dict, title: str = "") -> Tuple:        
-        sorted_dict: Dict = {k: v for k, v in sorted(mc_results.items(), reverse=True)}
-                
-        percentile_50_target: int = self.trials * self.percentile_50
-        percentile_70_target: int = self.trials * self.percentile_70
-        percentile_85_target: int = self.trials * self.percentile_85
-        percentile_95_target: int = self.trials * self.percentile_95
-        
-        percentile_50: int = 0
-        percentile_70: int = 0
-        percentile_85: int = 0
-        percentile_95: int = 0
-        
-        count: int = 0
-                
-        for key, value in sorted_dict.items():
-            count += value
-                    
-            if percentile_50 == 0 and count >= percentile_50_target:
-                percentile_50 = key
-            elif percentile_70 == 0 and count >= percentile_70_target:
-                percentile_70 = key
-            elif percentile_85 == 0 and count >= percentile_85_target:
-                percentile_85 = key
-            elif percentile_95 == 0 and count >= percentile_95_target:
-                percentile_95 = key
-                
-        if self.save_charts:
-            vertical_lines_data: List[Tuple[int, str, str]] = [
-                (percentile_50, '50th Percentile', "red"), 
-                (percentile_70, '70th Percentile', "orange"), 
-                (percentile_85, '85th Percentile', "lightgreen"), 
-                (percentile_95, '95th Percentile', "darkgreen")
-            ] 
-
-            plt.figure(figsize=(15, 9))
-            how_many_chart_path: str = os.path.join(self.charts_folder, 'MC_HowMany.png')
-            print(f"Storing Chart at {how_many_chart_path}")
-            plt.bar(list(sorted_dict.keys()), sorted_dict.values(), color='g')
-            
-            for position, line_name, color in vertical_lines_data:
-                plt.axvline(x=position, color=color, linestyle='--', label=f"{line_name} ({position})")
-
-            plt.legend()
-            plt.title(title)
-            plt.savefig(how_many_chart_path)
-            plt.show()
-        
-        return (percentile_50, percentile_70, percentile_85, percentile_95)
+    def __get_predictions_howmany(self, mc_results: Histogram, title: str = "") -> Tuple:
+        predictions: List[int] = mc_results.quantiles(self.percentiles, descending=True)
 
-    def __prepare_monte_carlo_dataset(self, start_date: date, time_delta: date, closed_items_hist: Dict) -> List[int]:
-        monte_carlo_data: List[int] = []
-        
-        for i in range((start_date - time_delta).days):
-            day: date = date.today() - timedelta(days=i)
-            daystr: str = day.strftime("%Y-%m-%d")
-            monte_carlo_data.append(closed_items_hist.loc[closed_items_hist['Done Date'] == daystr, 'Items'].sum())
-        
-        return monte_carlo_data
+        if self.chart_renderer is not None:
+            vertical_lines_data: List[Tuple[int, str, str, Optional[date]]] = [
+                (value, f"{percentile_label(percentile, '')}th Percentile", PERCENTILE_COLORS[index % len(PERCENTILE_COLORS)], None)
+                for index, (percentile, value) in enumerate(zip(self.percentiles, predictions))
+            ]
+            self.chart_renderer.render_how_many(mc_results.to_dict(), vertical_lines_data, title)
+
+        return tuple(predictions)
+
+    def get_throughput_index(self, closed_items_hist: ClosedItemsHistory) -> DailyThroughput:
+        key: int = id(closed_items_hist)
+
+        if key not in self.__throughput_index_cache:
+            throughput_index: DailyThroughput = closed_items_hist if isinstance(closed_items_hist, DailyThroughput) else DailyThroughput(closed_items_hist)
+            self.__throughput_index_cache[key] = (closed_items_hist, throughput_index)
+
+        return self.__throughput_index_cache[key][1]
+
+    def __prepare_monte_carlo_dataset(self, start_date: date, closed_items_hist: ClosedItemsHistory) -> np.ndarray:
+        key: Tuple[int, date, int] = (id(closed_items_hist), start_date, self.history_in_days)
+
+        if key not in self.__throughput_window_cache:
+            with PROFILER.stage("monte_carlo.prepare_dataset"):
+                throughput_index: DailyThroughput = self.get_throughput_index(closed_items_hist)
+                self.__throughput_window_cache[key] = throughput_index.window(start_date, self.history_in_days)
+
+        return self.__throughput_window_cache[key]
+
+    # The window as the sampling strategy draws it, the alias table is built once per window
+    def __prepare_sampling(self, start_date: date, closed_items_hist: ClosedItemsHistory) -> Tuple[np.ndarray, Optional[AliasTable]]:
+        key: Tuple[int, date, int] = (id(closed_items_hist), start_date, self.history_in_days)
+
+        if key not in self.__sampling_cache:
+            monte_carlo_data: np.ndarray = self.__prepare_monte_carlo_dataset(start_date, closed_items_hist)
+            with PROFILER.stage("monte_carlo.prepare_sampling"):
+                self.__sampling_cache[key] = self.sampling.prepare(monte_carlo_data, start_date)
+
+        return self.__sampling_cache[key]
@@ -0,0 +1,182 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds of the request latency buckets in seconds, the last bucket is open ended
+LATENCY_BUCKETS: Tuple[float, ...] = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Stage:
+
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self.profiler: Profiler = profiler
+        self.name: str = name
+        self.values: Dict[str, float] = {}
+        self.start: float = 0.0
+
+    def __enter__(self) -> "Stage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.profiler.record_stage(self.name, self.start, time.perf_counter(), self.values)
+        return False
+
+    # Work done in the stage, e.g. trials or issues, reported as totals and per second
+    def add(self, **values: float) -> None:
+        for name, value in values.items():
+            self.values[name] = self.values.get(name, 0) + value
+
+
+# Handed out while the profiler is disabled, so an instrumented block costs one
+# attribute check and two no-op calls
+class NullStage:
+
+    def __enter__(self) -> "NullStage":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def add(self, **values: float) -> None:
+        pass
+
+
+NULL_STAGE: NullStage = NullStage()
+
+
+# Collects per stage wall time, per endpoint request counts, bytes and latency
+# histograms. Stages can overlap (concurrent requests, the chart thread), so stage
+# times do not add up to the run time. Trace events are only kept when asked for.
+class Profiler:
+
+    def __init__(self, enabled: bool = False, trace: bool = False) -> None:
+        self.enabled: bool = enabled
+        self.trace: bool = trace
+        self.lock: threading.Lock = threading.Lock()
+        self.reset()
+
+    def enable(self, trace: bool = False) -> None:
+        self.trace = self.trace or trace
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self.lock:
+            self.origin: float = time.perf_counter()
+            self.stages: Dict[str, Dict[str, float]] = {}
+            self.requests: Dict[str, Dict] = {}
+            self.events: List[Dict] = []
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def record_stage(self, name: str, start: float, end: float, values: Dict[str, float]) -> None:
+        with self.lock:
+            stage: Dict[str, float] = self.stages.setdefault(name, {"count": 0, "seconds": 0.0})
+            stage["count"] += 1
+            stage["seconds"] += end - start
+            for value_name, value in values.items():
+                stage[value_name] = stage.get(value_name, 0) + value
+            if self.trace:
+                self.__add_event(name, "stage", start, end, values)
+
+    def record_request(self, endpoint: str, status: int, size: int, start: float, end: float) -> None:
+        with self.lock:
+            request: Dict = self.requests.setdefault(endpoint, {"count": 0, "errors": 0, "bytes": 0, "seconds": 0.0,
+                                                                 "status": {}, "latency": [0] * (len(LATENCY_BUCKETS) + 1)})
+            request["count"] += 1
+            request["errors"] += status != 200
+            request["bytes"] += size
+            request["seconds"] += end - start
+            request["status"][status] = request["status"].get(status, 0) + 1
+            request["latency"][bisect_left(LATENCY_BUCKETS, end - start)] += 1
+            if self.trace:
+                self.__add_event(endpoint, "request", start, end, {"status": status, "bytes": size})
+
+    def __add_event(self, name: str, category: str, start: float, end: float, values: Dict) -> None:
+        self.events.append({"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                            "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6, "args": dict(values)})
+
+    # Plain dict of all counters, e.g. for the metrics endpoint of the forecast server
+    def snapshot(self) -> Dict:
+        with self.lock:
+            stages: Dict[str, Dict[str, float]] = {}
+            for name, stage in self.stages.items():
+                stages[name] = dict(stage)
+                for value_name in stage.keys() - {"count", "seconds"}:
+                    stages[name][f"{value_name}_per_second"] = stage[value_name] / stage["seconds"] if stage["seconds"] > 0 else 0.0
+
+            requests: Dict[str, Dict] = {}
+            for endpoint, request in self.requests.items():
+                requests[endpoint] = {**request, "status": {str(status): count for status, count in request["status"].items()},
+                                      "mean_seconds": request["seconds"] / request["count"],
+                                      "latency": {label: count for label, count in zip(self.__bucket_labels(), request["latency"])}}
+
+            return {"stages": stages, "requests": requests}
+
+    @staticmethod
+    def __bucket_labels() -> List[str]:
+        return [f"<={bound:g}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]:g}s"]
+
+    def report(self) -> str:
+        snapshot: Dict = self.snapshot()
+        lines: List[str] = [f"{'Stage':<32}{'Calls':>8}{'Total s':>12}{'Mean ms':>12}  Throughput"]
+
+        for name, stage in sorted(snapshot["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            rates: str = ", ".join(f"{stage[value_name]:,.0f} {value_name.removesuffix('_per_second')}/s"
+                                   for value_name in sorted(stage) if value_name.endswith("_per_second"))
+            lines.append(f"{name:<32}{stage['count']:>8}{stage['seconds']:>12.3f}{stage['seconds'] / stage['count'] * 1000:>12.2f}  {rates}")
+
+        for endpoint, request in sorted(snapshot["requests"].items()):
+            latency: str = " ".join(f"{label}:{count}" for label, count in request["latency"].items() if count)
+            lines.append(f"Requests {endpoint}: {request['count']} ({request['errors']} not 200), {request['bytes'] / 1e6:.2f} MB, "
+                         f"mean {request['mean_seconds'] * 1000:.1f} ms, latency {latency}")
+
+        return "\n".join(lines)
+
+    def print_report(self, trace_path: Optional[str] = None) -> None:
+        print("================================================================")
+        print("Profile")
+        print("================================================================")
+        print(self.report())
+        if trace_path is not None:
+            self.write_chrome_trace(trace_path)
+            print(f"Chrome trace written to {trace_path}")
+
+    # Chrome trace event format, open it in chrome://tracing or https://ui.perfetto.dev
+    def write_chrome_trace(self, path: str) -> None:
+        with self.lock:
+            events: List[Dict] = list(self.events)
+        with open(path, 'w') as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    # Runs the block under cProfile and dumps the pstats file, a no-op without a path
+    @staticmethod
+    @contextmanager
+    def cprofile(path: Optional[str]) -> Iterator[None]:
+        if path is None:
+            yield
+            return
+
+        profile: cProfile.Profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+            print(f"cProfile stats written to {path}, view them with: python -m pstats {path}")
+
+
+# Process wide instance, disabled until a --Profile flag or the caller enables it
+PROFILER: Profiler = Profiler()
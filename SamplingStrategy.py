@@ -0,0 +1,104 @@
+import re
+import numpy as np
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from AliasTable import AliasTable
+
+DEFAULT_HALF_LIFE: float = 30.0
+# Monday to Sunday
+DEFAULT_WEEKDAY_WEIGHTS: Tuple[float, ...] = (1.0, 1.0, 1.0, 1.0, 1.0, 0.0, 0.0)
+
+
+# How the days of the history window are drawn. The weights are turned into an alias
+# table once per window, so a weighted draw in the engines costs the same for any
+# strategy and window length.
+#   uniform: every day alike, the original behaviour
+#   recency: the weight halves every half_life days back from the start date, so a long
+#            --History fades out instead of being cut off hard
+#   weekday: weighted per weekday, holidays get weight 0. Days with weight 0 are not
+#            worked: they are skipped when simulated days are turned into dates, so
+#            forecasts count working days on both sides.
+#   values:  draws the distinct daily throughput values by their frequency. The same
+#            distribution as uniform, from a table that is as long as the number of
+#            distinct values instead of the number of days.
+class SamplingStrategy:
+
+    NAMES: Tuple[str, ...] = ("uniform", "recency", "weekday", "values")
+
+    def __init__(self, name: str = "uniform", half_life: float = DEFAULT_HALF_LIFE,
+                 weekday_weights: Sequence[float] = DEFAULT_WEEKDAY_WEIGHTS, holidays: Iterable[date] = ()) -> None:
+        if name not in self.NAMES:
+            raise ValueError(f"Unknown sampling strategy '{name}', expected one of {', '.join(self.NAMES)}")
+        if half_life <= 0:
+            raise ValueError("The half life must be positive")
+        if len(weekday_weights) != 7 or any(weight < 0 for weight in weekday_weights) or not any(weight > 0 for weight in weekday_weights):
+            raise ValueError("Weekday weights need 7 values (Monday to Sunday), not negative and at least one positive")
+
+        self.name: str = name
+        self.half_life: float = half_life
+        self.weekday_weights: np.ndarray = np.asarray(weekday_weights, dtype=np.float64)
+        self.holidays: np.ndarray = np.unique(np.asarray(list(holidays), dtype='datetime64[D]'))
+        self.calendar: Optional[np.busdaycalendar] = np.busdaycalendar(weekmask=list(self.weekday_weights > 0), holidays=self.holidays) \
+            if name == "weekday" else None
+
+    # np.busdaycalendar can not be pickled, a copy in a worker process builds its own
+    def __reduce__(self) -> tuple:
+        return SamplingStrategy, (self.name, self.half_life, tuple(self.weekday_weights), self.holidays.astype(date).tolist())
+
+    # One date per line, optionally followed by a name after a ';', ',' or tab. Empty
+    # lines and lines starting with # are skipped.
+    @staticmethod
+    def read_holidays(file_name: str, date_format: str = "%Y-%m-%d") -> List[date]:
+        holidays: List[date] = []
+
+        with open(file_name) as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                holidays.append(datetime.strptime(re.split(r"[;,\t]", line, maxsplit=1)[0].strip(), date_format).date())
+
+        return holidays
+
+    # Weight of every day of the history_in_days days up to start_date, oldest first.
+    # None means uniform.
+    def day_weights(self, start_date: date, history_in_days: int) -> Optional[np.ndarray]:
+        if self.name == "recency":
+            ages: np.ndarray = np.arange(history_in_days - 1, -1, -1, dtype=np.float64)
+            return 0.5 ** (ages / self.half_life)
+
+        if self.name == "weekday":
+            first_day: np.datetime64 = np.datetime64(start_date - timedelta(history_in_days - 1), 'D')
+            days: np.ndarray = first_day + np.arange(history_in_days)
+            # 1970-01-01 was a Thursday
+            weights: np.ndarray = self.weekday_weights[(days.astype(np.int64) + 3) % 7]
+            weights[np.isin(days, self.holidays)] = 0.0
+            return weights
+
+        return None
+
+    # The throughput values and the alias table the engines draw them with
+    def prepare(self, window: np.ndarray, start_date: date) -> Tuple[np.ndarray, Optional[AliasTable]]:
+        if self.name == "values":
+            values, frequencies = np.unique(window, return_counts=True)
+            return values, AliasTable(frequencies)
+
+        weights: Optional[np.ndarray] = self.day_weights(start_date, len(window))
+        if weights is not None and np.any(window > 0) and not np.any(weights[window > 0] > 0):
+            raise ValueError(f"The {self.name} sampling weights leave no day with closed items in the history window")
+        return window, AliasTable(weights) if weights is not None else None
+
+    # Simulated days from start_date (exclusive) to target_date (inclusive)
+    def days_between(self, start_date: date, target_date: date) -> int:
+        if self.calendar is None:
+            return (target_date - start_date).days
+
+        return int(np.busday_count(start_date + timedelta(1), target_date + timedelta(1), busdaycal=self.calendar))
+
+    # The date on which the given number of simulated days after start_date is done
+    def date_after(self, start_date: date, days: int) -> date:
+        if self.calendar is None or days <= 0:
+            return start_date + timedelta(days)
+
+        return np.busday_offset(start_date + timedelta(1), days - 1, roll='forward', busdaycal=self.calendar).astype(date)
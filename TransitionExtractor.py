@@ -0,0 +1,95 @@
+import json
+from datetime import datetime, timezone
+from typing import Iterable, NamedTuple, Optional, Sequence, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+    # Only the C backend is faster than a full orjson parse, the pure python one is not
+    STREAMING = ijson.backend == "yajl2_c"
+except ImportError:
+    ijson = None
+    STREAMING = False
+
+START_STATUSES = ("In Progress",)
+DONE_STATUSES = ("Done", "Closed")
+SECONDS_PER_DAY = 3600 * 24
+
+
+def parseTimestamp(value: Union[str, int, float]) -> datetime:
+    # The bulk changelog endpoint sends milliseconds since the epoch
+    if not isinstance(value, str):
+        return datetime.fromtimestamp(float(value) / 1000, tz=timezone.utc)
+    # Jira sends '2024-05-01T10:00:00.000+0200', which fromisoformat parses since python 3.11
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f%z')
+
+
+class Transitions(NamedTuple):
+    start: Optional[datetime]
+    done: Optional[datetime]
+    created: Optional[datetime] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.start is not None and self.done is not None
+
+    # Cycle time in days: from the start transition to the done transition
+    @property
+    def cycle_time(self) -> Optional[float]:
+        return (self.done - self.start).total_seconds() / SECONDS_PER_DAY if self.complete else None
+
+    # Lead time in days: from the creation of the issue to the done transition
+    @property
+    def lead_time(self) -> Optional[float]:
+        return (self.done - self.created).total_seconds() / SECONDS_PER_DAY if self.done and self.created else None
+
+
+# Finds the start and done transitions in an issue changelog. Histories are scanned
+# oldest first and the scan stops at the first history where both are known, so
+# only the histories up to the done transition are ever parsed.
+class TransitionExtractor:
+
+    def __init__(self, start_statuses: Sequence[str] = START_STATUSES, done_statuses: Sequence[str] = DONE_STATUSES) -> None:
+        self.start_statuses = frozenset(start_statuses)
+        self.done_statuses = frozenset(done_statuses)
+
+    def extract(self, histories: Iterable[dict], created: Optional[Union[str, datetime]] = None) -> Transitions:
+        start = None
+        done = None
+
+        for history in histories:
+            for item in history['items']:
+                if item['field'] != 'status':
+                    continue
+                to_status = item['toString']
+                if to_status in self.done_statuses:
+                    done = history['created']
+                if to_status in self.start_statuses:
+                    start = history['created']
+                    if done is not None:
+                        break
+            if start is not None and done is not None:
+                break
+
+        if isinstance(created, str):
+            created = parseTimestamp(created)
+
+        return Transitions(parseTimestamp(start) if start is not None else None, parseTimestamp(done) if done is not None else None, created)
+
+    # Extracts the transitions straight from an '?expand=changelog' response. With the
+    # ijson C backend the histories are streamed and the rest of the payload is never
+    # parsed, otherwise the payload is parsed with orjson, or json as a last resort.
+    def extractFromResponse(self, payload: Union[str, bytes], created: Optional[Union[str, datetime]] = None) -> Transitions:
+        if STREAMING:
+            data = payload.encode() if isinstance(payload, str) else payload
+            return self.extract(ijson.items(data, 'changelog.histories.item'), created)
+
+        response = orjson.loads(payload) if orjson is not None else json.loads(payload)
+        return self.extract(response['changelog']['histories'], created)
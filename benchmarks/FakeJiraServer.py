@@ -0,0 +1,237 @@
+# Local stand-in for the Jira REST API, so syncs can be measured without an Atlassian
+# instance. Serves /rest/api/2/search (paged, optionally with expand=changelog),
+# /rest/api/2/issue/{key}?expand=changelog and optionally the bulk changelog endpoint
+# /rest/api/3/changelog/bulkfetch from SyntheticIssues, with configurable latency, page
+# size cap, cap of the histories embedded in search results and 429 rate limiting.
+# Responses are gzip compressed when the client accepts it, like Jira does.
+#   python -m benchmarks.FakeJiraServer --Issues 1000 --Latency 0.05 --RateLimit 100
+import argparse
+import asyncio
+import gzip
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from aiohttp import web
+
+from benchmarks.SyntheticIssues import SyntheticIssues
+
+DEFAULT_HOST: str = "127.0.0.1"
+
+
+class FakeJiraServer:
+
+    def __init__(self, issues: SyntheticIssues, latency: float = 0.0, page_size: int = 100, rate_limit: Optional[int] = None,
+                 host: str = DEFAULT_HOST, port: int = 0, changelog_cap: Optional[int] = None, bulk_changelog: bool = True) -> None:
+        self.issues: SyntheticIssues = issues
+        # Seconds added to every response, like the round trip to a remote instance
+        self.latency: float = latency
+        # Upper bound for maxResults, Jira Cloud applies 100 and reports it in the response
+        self.page_size: int = page_size
+        # Requests per second, above it the server answers 429 with a Retry-After header
+        self.rate_limit: Optional[int] = rate_limit
+        # Histories embedded per issue in search results, Jira Cloud embeds 100 and
+        # reports the full count in changelog.total. None embeds all, like Jira Server.
+        self.changelog_cap: Optional[int] = changelog_cap
+        # Without it /rest/api/3/changelog/bulkfetch answers 404, like Jira Server
+        self.bulk_changelog: bool = bulk_changelog
+        self.host: str = host
+        self.port: int = port
+
+        self.stats: Dict[str, int] = {"requests": 0, "search": 0, "changelog": 0, "bulk_changelog": 0, "rate_limited": 0, "bytes": 0}
+        self.__window_start: float = 0.0
+        self.__window_requests: int = 0
+        self.__runner: Optional[web.AppRunner] = None
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> str:
+        app: web.Application = web.Application(middlewares=[self.__throttle])
+        app.router.add_get("/rest/api/2/search", self.__search)
+        app.router.add_get("/rest/api/2/issue/{key}", self.__issue)
+        app.router.add_get("/rest/api/2/myself", self.__myself)
+        if self.bulk_changelog:
+            app.router.add_post("/rest/api/3/changelog/bulkfetch", self.__bulk_changelog)
+
+        self.__runner = web.AppRunner(app, access_log=None)
+        await self.__runner.setup()
+        site: web.TCPSite = web.TCPSite(self.__runner, self.host, self.port)
+        await site.start()
+        # Port 0 picks a free port, read back the one that was bound
+        self.port = self.__runner.addresses[0][1]
+        return self.url
+
+    async def stop(self) -> None:
+        if self.__runner is not None:
+            await self.__runner.cleanup()
+            self.__runner = None
+
+    # Runs the server on its own event loop in a daemon thread, for synchronous
+    # callers such as pytest-benchmark that run the client with asyncio.run()
+    def start_in_thread(self) -> str:
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, name="fake-jira", daemon=True)
+        self.__thread.start()
+        return asyncio.run_coroutine_threadsafe(self.start(), self.__loop).result()
+
+    def stop_thread(self) -> None:
+        if self.__loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self.__loop).result()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop.close()
+        self.__loop = self.__thread = None
+
+    @contextmanager
+    def running(self) -> Iterator[str]:
+        url: str = self.start_in_thread()
+        try:
+            yield url
+        finally:
+            self.stop_thread()
+
+    def reset_stats(self) -> None:
+        for name in self.stats:
+            self.stats[name] = 0
+
+    @web.middleware
+    async def __throttle(self, request: web.Request, handler) -> web.StreamResponse:
+        self.stats["requests"] += 1
+
+        if self.rate_limit is not None:
+            now: float = time.monotonic()
+            if now - self.__window_start >= 1.0:
+                self.__window_start, self.__window_requests = now, 0
+            self.__window_requests += 1
+            if self.__window_requests > self.rate_limit:
+                self.stats["rate_limited"] += 1
+                retry_after: float = 1.0 - (now - self.__window_start)
+                return web.json_response({"errorMessages": ["Rate limit exceeded"]}, status=429,
+                                         headers={"Retry-After": f"{max(retry_after, 0.01):.2f}"})
+
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        response: web.StreamResponse = await handler(request)
+        self.stats["bytes"] += response.content_length or 0
+        return response
+
+    async def __search(self, request: web.Request) -> web.Response:
+        self.stats["search"] += 1
+        start_at: int = int(request.query.get("startAt", "0"))
+        max_results: int = min(int(request.query.get("maxResults", str(self.page_size))), self.page_size)
+        fields: Optional[List[str]] = self.__fields(request)
+        expand_changelog: bool = "changelog" in request.query.get("expand", "").split(",")
+
+        page: List[Dict] = []
+        for index in range(start_at, min(start_at + max_results, self.issues.count)):
+            issue: Dict = self.issues.issue(index, fields)
+            if expand_changelog:
+                issue["changelog"] = self.__capped(self.issues.changelog(index))
+            page.append(issue)
+
+        return self.__json(request, {"startAt": start_at, "maxResults": max_results, "total": self.issues.count, "issues": page})
+
+    async def __issue(self, request: web.Request) -> web.Response:
+        index: Optional[int] = self.issues.index(request.match_info["key"])
+        if index is None:
+            return web.json_response({"errorMessages": ["Issue does not exist"]}, status=404)
+
+        self.stats["changelog"] += 1
+        issue: Dict = self.issues.issue(index, self.__fields(request))
+        if "changelog" in request.query.get("expand", "").split(","):
+            issue["changelog"] = self.issues.changelog(index)
+        return self.__json(request, issue)
+
+    # The timestamps of the synthetic issues are in UTC, so is the user's profile
+    async def __myself(self, request: web.Request) -> web.Response:
+        return self.__json(request, {"accountId": "synthetic", "displayName": "Synthetic User", "timeZone": "UTC"})
+
+    # Pages over the histories of all requested issues, at most maxResults per page,
+    # nextPageToken is the position of the first history of the next page
+    async def __bulk_changelog(self, request: web.Request) -> web.Response:
+        self.stats["bulk_changelog"] += 1
+        body: Dict = await request.json()
+        field_ids: List[str] = body.get("fieldIds") or []
+        max_results: int = int(body.get("maxResults", 1000))
+        position: int = int(body.get("nextPageToken") or 0)
+
+        issue_changelogs: List[Dict] = []
+        histories_seen: int = 0
+        for issue_id in body.get("issueIdsOrKeys", []):
+            index: Optional[int] = self.issues.index(str(issue_id))
+            if index is None:
+                continue
+            histories: List[Dict] = self.issues.changelog(index, epoch_millis=True)["histories"]
+            if field_ids:
+                histories = [{**history, "items": [item for item in history["items"] if item["field"] in field_ids]} for history in histories]
+                histories = [history for history in histories if history["items"]]
+            # Only the part of this issue's histories that falls into the page
+            page_histories: List[Dict] = histories[max(position - histories_seen, 0):max(position + max_results - histories_seen, 0)]
+            histories_seen += len(histories)
+            if page_histories:
+                issue_changelogs.append({"issueId": self.issues.issue_id(index), "changeHistories": page_histories})
+
+        response: Dict = {"issueChangeLogs": issue_changelogs}
+        if histories_seen > position + max_results:
+            response["nextPageToken"] = str(position + max_results)
+        return self.__json(request, response)
+
+    @staticmethod
+    def __fields(request: web.Request) -> Optional[List[str]]:
+        return [name for name in request.query.get("fields", "").split(",") if name] or None
+
+    def __capped(self, changelog: Dict) -> Dict:
+        if self.changelog_cap is None or changelog["total"] <= self.changelog_cap:
+            return changelog
+        return {**changelog, "maxResults": self.changelog_cap, "histories": changelog["histories"][:self.changelog_cap]}
+
+    @staticmethod
+    def __json(request: web.Request, body: Dict) -> web.Response:
+        payload: bytes = json.dumps(body).encode()
+        if "gzip" not in request.headers.get("Accept-Encoding", ""):
+            return web.Response(body=payload, content_type="application/json")
+        return web.Response(body=gzip.compress(payload, compresslevel=6), content_type="application/json", headers={"Content-Encoding": "gzip"})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--Issues", default="1000")
+    parser.add_argument("--Seed", default="1")
+    parser.add_argument("--Histories", default="20")
+    parser.add_argument("--Latency", default="0", help="seconds per response")
+    parser.add_argument("--PageSize", default="100")
+    parser.add_argument("--RateLimit", default=None, help="requests per second before answering 429")
+    parser.add_argument("--ChangelogCap", default=None, help="histories embedded per issue in search results")
+    parser.add_argument("--BulkChangelog", default=True, action=argparse.BooleanOptionalAction)
+    parser.add_argument("--Host", default=DEFAULT_HOST)
+    parser.add_argument("--Port", default="8765")
+    args = parser.parse_args()
+
+    issues = SyntheticIssues(int(args.Issues), int(args.Seed), histories=int(args.Histories))
+    server = FakeJiraServer(issues, float(args.Latency), int(args.PageSize), int(args.RateLimit) if args.RateLimit else None,
+                            args.Host, int(args.Port), int(args.ChangelogCap) if args.ChangelogCap else None, args.BulkChangelog)
+
+    async def serve() -> None:
+        print(f"Serving {issues.count} synthetic issues on {await server.start()}, use it as API_URL in secrets.yaml")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+            print(f"Stats: {server.stats}")
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
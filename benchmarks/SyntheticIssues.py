@@ -0,0 +1,115 @@
+import numpy as np
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# The sizes the benchmark suites run over, in closed items
+SIZES: Tuple[int, ...] = (100, 1_000, 10_000, 100_000, 1_000_000)
+ISSUE_TYPES: Tuple[str, ...] = ("Story", "Task", "Bug", "Improvement")
+POINTS: Tuple[int, ...] = (1, 2, 3, 5, 8)
+TIMESTAMP_FORMAT: str = '%Y-%m-%dT%H:%M:%S.000+0000'
+STORYPOINTS: str = "customfield_10014"
+
+
+# Deterministic closed issues for benchmarks. Everything is drawn up front into NumPy
+# arrays (a million issues take a few MB), the Jira shaped dicts and changelogs are
+# only built when an issue is asked for, so the fake server can page through 1M issues.
+class SyntheticIssues:
+
+    def __init__(self, count: int, seed: int = 1, end_date: date = date(2024, 5, 1), days: int = 365,
+                 histories: int = 20, project: str = "SYN") -> None:
+        self.count: int = count
+        self.seed: int = seed
+        self.end_date: date = end_date
+        self.days: int = days
+        self.histories: int = histories
+        self.project: str = project
+
+        rng: np.random.Generator = np.random.default_rng(seed)
+        first_day: datetime = datetime(end_date.year, end_date.month, end_date.day, tzinfo=timezone.utc) - timedelta(days=days - 1)
+        self.origin: datetime = first_day
+        # Seconds since origin. Done times are spread over the window, cycle and lead
+        # times are lognormal like real ones: most items are quick, some take weeks.
+        self.done: np.ndarray = rng.integers(9 * 3600, days * 86400 - 6 * 3600, count)
+        self.cycle: np.ndarray = np.minimum((rng.lognormal(1.0, 0.8, count) * 86400).astype(np.int64), 120 * 86400)
+        self.wait: np.ndarray = (rng.lognormal(0.5, 1.0, count) * 86400).astype(np.int64)
+        self.points: np.ndarray = rng.choice(POINTS, count)
+        self.types: np.ndarray = rng.integers(0, len(ISSUE_TYPES), count)
+
+    def key(self, index: int) -> str:
+        return f"{self.project}-{index + 1}"
+
+    def issue_id(self, index: int) -> str:
+        return str(10000 + index)
+
+    # Accepts an issue key or id, like the Jira endpoints do
+    def index(self, key: str) -> Optional[int]:
+        if key.isdigit():
+            return int(key) - 10000 if 0 <= int(key) - 10000 < self.count else None
+        project, _, number = key.partition("-")
+        if project != self.project or not number.isdigit() or not 0 < int(number) <= self.count:
+            return None
+        return int(number) - 1
+
+    def __timestamp(self, seconds: int) -> str:
+        return (self.origin + timedelta(seconds=int(seconds))).strftime(TIMESTAMP_FORMAT)
+
+    def __epoch_millis(self, seconds: int) -> int:
+        return int((self.origin + timedelta(seconds=int(seconds))).timestamp()) * 1000
+
+    def times(self, index: int) -> Tuple[int, int, int]:
+        done: int = int(self.done[index])
+        start: int = done - int(self.cycle[index])
+        return start - int(self.wait[index]), start, done
+
+    def fields(self, index: int) -> Dict:
+        created, _, done = self.times(index)
+        return {
+            "issuetype": {"name": ISSUE_TYPES[self.types[index]]},
+            "summary": f"Synthetic issue {index + 1}",
+            "created": self.__timestamp(created),
+            "updated": self.__timestamp(done + 3600),
+            "resolved": self.__timestamp(done),
+            STORYPOINTS: int(self.points[index])
+        }
+
+    def issue(self, index: int, fields: Optional[List[str]] = None) -> Dict:
+        issue_fields: Dict = self.fields(index)
+        if fields:
+            issue_fields = {name: value for name, value in issue_fields.items() if name in fields}
+        return {"id": self.issue_id(index), "key": self.key(index), "fields": issue_fields}
+
+    # Status changes into In Progress and Done, with field edits before and after them,
+    # so a parser has to skip entries like on a real changelog. The bulk changelog
+    # endpoint sends created as milliseconds since the epoch instead of a string.
+    def changelog(self, index: int, epoch_millis: bool = False) -> Dict:
+        created, start, done = self.times(index)
+        timestamp: Callable[[int], Union[str, int]] = self.__epoch_millis if epoch_millis else self.__timestamp
+        steps: np.ndarray = np.linspace(created, done + 86400, self.histories + 2, dtype=np.int64)[1:-1]
+        histories: List[Dict] = []
+
+        for number, seconds in enumerate(steps):
+            histories.append({"id": str(number), "created": timestamp(seconds),
+                              "items": [{"field": "description", "fromString": "old", "toString": "updated description"}]})
+        histories.append({"id": "start", "created": timestamp(start),
+                          "items": [{"field": "status", "fromString": "To Do", "toString": "In Progress"}]})
+        histories.append({"id": "done", "created": timestamp(done),
+                          "items": [{"field": "status", "fromString": "In Progress", "toString": "Done"}]})
+
+        histories.sort(key=lambda history: history["created"])
+        return {"startAt": 0, "maxResults": len(histories), "total": len(histories), "histories": histories}
+
+    def done_dates(self) -> np.ndarray:
+        return np.datetime64(self.origin.date(), 'D') + (self.done // 86400).astype('timedelta64[D]')
+
+    # The closed items history as MonteCarlo.py reads it from a csv file
+    def closed_items(self, items_column: str = "Points") -> "pd.DataFrame":
+        import pandas as pd
+
+        return pd.DataFrame({"Done Date": self.done_dates().astype(str), items_column: self.points})
+
+    def write_csv(self, file_name: str, delimiter: str = ";", items_column: str = "Points") -> str:
+        self.closed_items(items_column).to_csv(file_name, sep=delimiter, index=False)
+        return file_name
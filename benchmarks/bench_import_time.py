@@ -0,0 +1,58 @@
+# Guards the startup budget of the MonteCarlo.py CLI. Runs it under -X importtime
+# and fails if the imports take longer than the budget or pull in pandas/matplotlib
+# on the plain csv path without charts.
+#   python benchmarks/bench_import_time.py --FileName issue_throughput_60d.csv --Budget 400
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FORBIDDEN = ("pandas", "matplotlib")
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure(cli_args, repeat):
+    best_total = None
+    imported = set()
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT, "MonteCarlo.py")] + cli_args,
+                                cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise SystemExit(f"MonteCarlo.py failed:\n{result.stdout}\n{result.stderr}")
+
+        total = 0
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME.match(line)
+            if match is None:
+                continue
+            imported.add(match.group(4).split(".")[0])
+            # Only top level entries, their cumulative time already contains the nested imports
+            if len(match.group(3)) == 1:
+                total += int(match.group(2))
+        best_total = total if best_total is None else min(best_total, total)
+    return best_total / 1000, imported
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--FileName", default="issue_throughput_60d.csv")
+    parser.add_argument("--Budget", default="400", help="allowed import time in ms")
+    parser.add_argument("--Repeat", default="3")
+    args = parser.parse_args()
+
+    cli_args = ["--FileName", os.path.abspath(args.FileName), "--no-SaveCharts", "--Trials", "1000"]
+    import_ms, imported = measure(cli_args, int(args.Repeat))
+    forbidden = sorted(module for module in FORBIDDEN if module in imported)
+
+    print(f"Import time: {import_ms:.1f} ms (budget {args.Budget} ms)")
+    if forbidden:
+        print(f"FAIL: {', '.join(forbidden)} imported on the plain csv path")
+    if import_ms > float(args.Budget):
+        print("FAIL: import time over budget")
+    sys.exit(1 if forbidden or import_ms > float(args.Budget) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Dataset preparation, simulations and percentile extraction on synthetic histories.
+#   pytest benchmarks/bench_simulation.py --Sizes 100,10000,1000000
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import MonteCarloEngine
+from Backtest import Backtest
+from DailyThroughput import DailyThroughput
+from Histogram import Histogram
+from MonteCarloService import MonteCarloService
+from SamplingStrategy import SamplingStrategy
+from benchmarks.conftest import synthetic_issues
+
+TRIALS = (1_000, 10_000, 100_000, 1_000_000)
+HISTORY = 60
+FORECAST_DAYS = 30
+SIMULATION_SIZE = 10_000
+START_DATE = synthetic_issues(SIMULATION_SIZE).end_date
+TARGET_DATE = START_DATE + timedelta(FORECAST_DAYS)
+
+
+@pytest.fixture(scope="module")
+def closed_items():
+    return DailyThroughput(synthetic_issues(SIMULATION_SIZE).closed_items("Items"))
+
+
+@pytest.fixture(scope="module")
+def remaining_items(closed_items):
+    # About FORECAST_DAYS days of work, so 'when' and 'how many' look at the same horizon
+    return int(closed_items.window(START_DATE, HISTORY).mean() * FORECAST_DAYS)
+
+
+def bench_read_csv(benchmark, size, tmp_path_factory):
+    file_name = synthetic_issues(size).write_csv(str(tmp_path_factory.mktemp("csv") / "throughput.csv"))
+    throughput = benchmark(DailyThroughput.from_csv, file_name, ";", "Done Date", "Points")
+    assert throughput.record_count == size
+
+
+def bench_prepare_dataset(benchmark, size):
+    history = synthetic_issues(size).closed_items("Items")
+    window = benchmark(lambda: DailyThroughput(history).window(START_DATE, HISTORY))
+    assert len(window) == HISTORY
+
+
+@pytest.mark.parametrize("trials", TRIALS)
+def bench_how_many(benchmark, closed_items, trials):
+    service = MonteCarloService(HISTORY, trials=trials, seed=1)
+    predictions = benchmark(service.how_many, START_DATE, TARGET_DATE, closed_items)
+    assert predictions[0] >= predictions[3]
+
+
+@pytest.mark.parametrize("trials", TRIALS)
+def bench_when(benchmark, closed_items, remaining_items, trials):
+    service = MonteCarloService(HISTORY, trials=trials, seed=1)
+    predictions = benchmark(service.when, remaining_items, closed_items, START_DATE, TARGET_DATE)
+    assert predictions[0] <= predictions[3]
+
+
+@pytest.mark.parametrize("forecast", ("how_many", "when"))
+def bench_exact(benchmark, closed_items, remaining_items, forecast):
+    service = MonteCarloService(HISTORY, engine="exact")
+    if forecast == "how_many":
+        benchmark(service.how_many, START_DATE, TARGET_DATE, closed_items)
+    else:
+        benchmark(service.when, remaining_items, closed_items, START_DATE, TARGET_DATE)
+
+
+# A fresh Histogram per round, so the cumulative distribution is computed every time
+@pytest.mark.parametrize("trials", TRIALS)
+def bench_percentiles(benchmark, closed_items, trials):
+    data = closed_items.window(START_DATE, HISTORY)
+    histogram = MonteCarloEngine.run_how_many(data, FORECAST_DAYS, trials, seed=1)
+    percentiles = benchmark(lambda: Histogram(histogram.counts, histogram.offset).quantiles([0.5, 0.7, 0.85, 0.95], descending=True))
+    assert percentiles == sorted(percentiles, reverse=True)
+
+
+@pytest.mark.parametrize("shards", (4, 40))
+def bench_merge_shards(benchmark, closed_items, shards):
+    data = closed_items.window(START_DATE, HISTORY)
+    histograms = [MonteCarloEngine.run_how_many(data, FORECAST_DAYS, 10_000, seed=shard) for shard in range(shards)]
+    merged = benchmark(lambda: sum(histograms[1:], histograms[0].copy()))
+    assert merged.total == shards * 10_000
+
+
+# 15 teams with the synthetic history scaled to different speeds, so they finish on different days
+@pytest.mark.parametrize("correlated", (False, True))
+def bench_portfolio(benchmark, closed_items, remaining_items, correlated):
+    data = closed_items.window(START_DATE, HISTORY)
+    team_data = [data * (1 + team % 5) for team in range(15)]
+    remaining_items_list = [remaining_items * (1 + team % 3) for team in range(15)]
+    portfolio = benchmark(MonteCarloEngine.run_portfolio, team_data, remaining_items_list, 1_000_000, correlated, seed=1)
+    assert portfolio.completion.total == 1_000_000
+
+
+# Weighted strategies draw through an alias table, uniform straight from the generator
+@pytest.mark.parametrize("strategy", SamplingStrategy.NAMES)
+def bench_sampling(benchmark, closed_items, remaining_items, strategy):
+    service = MonteCarloService(HISTORY, trials=1_000_000, seed=1, sampling=SamplingStrategy(strategy))
+    predictions = benchmark(service.when, remaining_items, closed_items, START_DATE, TARGET_DATE)
+    assert predictions[0] <= predictions[3]
+
+
+# Weekly cutoffs over the whole synthetic history, each with a how many and a when forecast
+def bench_backtest(benchmark, closed_items, remaining_items):
+    service = MonteCarloService(HISTORY, trials=10_000, seed=1)
+    backtest = Backtest(service, closed_items, FORECAST_DAYS, remaining_items)
+    results = benchmark(backtest.run, backtest.cutoffs())
+    assert results["How Many CRPS"].notna().all()
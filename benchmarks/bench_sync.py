@@ -0,0 +1,93 @@
+# Jira sync against the local FakeJiraServer: search pagination and the full
+# changelog sync of Jira_GetDurations, with a cold and a warm changelog cache, and
+# with the changelogs embedded in the search, fetched in bulk or fetched per issue.
+#   pytest benchmarks/bench_sync.py --SyncIssues 100,1000 --Latency 0.02
+import asyncio
+import itertools
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import Jira
+import Jira_GetDurations
+from ChangelogCache import ChangelogCache
+from TransitionExtractor import TransitionExtractor
+from benchmarks.FakeJiraServer import FakeJiraServer
+from benchmarks.conftest import synthetic_issues
+
+JQL = "project = SYN"
+FIELDS = Jira_GetDurations.SEARCH_FIELDS
+# How the changelogs of a cold sync are retrieved, as (changelog cap, bulk endpoint):
+# embedded in the search, capped and fetched in bulk, capped without bulk endpoint
+CHANGELOG_PATHS = {"search": (None, True), "bulk": (5, True), "issue": (5, False)}
+TOKEN = "benchmark"
+
+
+@pytest.fixture
+def fake_jira(sync_issues, latency):
+    server = FakeJiraServer(synthetic_issues(sync_issues), latency)
+    with server.running():
+        yield server
+
+
+async def search(url):
+    async with Jira.Jira(url, TOKEN) as jira:
+        return await jira.getJQL(JQL, FIELDS)
+
+
+async def sync(url, cache_path, expand_changelog=True):
+    async with Jira.Jira(url, TOKEN) as jira:
+        with ChangelogCache(cache_path) as cache:
+            return await Jira_GetDurations.fetchNewTransitions(jira, JQL, set(), cache, TransitionExtractor(), expandChangelog=expand_changelog)
+
+
+def bench_search(benchmark, fake_jira, sync_issues):
+    issues = benchmark.pedantic(lambda: asyncio.run(search(fake_jira.url)), rounds=3)
+    assert len(issues) == sync_issues
+
+
+# Every round starts with an empty cache, so every changelog is retrieved
+@pytest.mark.parametrize("path", CHANGELOG_PATHS)
+def bench_sync_cold_cache(benchmark, sync_issues, latency, tmp_path, path):
+    changelog_cap, bulk_changelog = CHANGELOG_PATHS[path]
+    server = FakeJiraServer(synthetic_issues(sync_issues), latency, changelog_cap=changelog_cap, bulk_changelog=bulk_changelog)
+    rounds = itertools.count()
+
+    def setup():
+        server.reset_stats()
+        return (server.url, str(tmp_path / f"cache_{next(rounds)}.sqlite")), {}
+
+    with server.running():
+        new_issues, transitions, failed = benchmark.pedantic(lambda url, cache_path: asyncio.run(sync(url, cache_path)), setup=setup, rounds=3)
+    assert len(new_issues) == sync_issues and all(transition.complete for transition in transitions)
+    assert failed == {"pages": 0, "issues": []}
+    assert server.stats["changelog"] == (sync_issues if path == "issue" else 0)
+    assert (server.stats["bulk_changelog"] > 0) == (path == "bulk")
+    benchmark.extra_info.update(requests=server.stats["requests"], bytes=server.stats["bytes"])
+
+
+# The cache is filled once, the measured rounds only search and answer from the cache
+def bench_sync_warm_cache(benchmark, fake_jira, sync_issues, tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite")
+    asyncio.run(sync(fake_jira.url, cache_path))
+    fake_jira.reset_stats()
+
+    new_issues, _, _ = benchmark.pedantic(lambda: asyncio.run(sync(fake_jira.url, cache_path)), rounds=3)
+    assert len(new_issues) == sync_issues and fake_jira.stats["changelog"] == 0
+
+
+# A server that allows half the issues per second, so the per issue sync runs into
+# 429s and waits for the Retry-After the server sends
+def bench_sync_rate_limited(benchmark, sync_issues, latency, tmp_path):
+    server = FakeJiraServer(synthetic_issues(sync_issues), latency, rate_limit=max(sync_issues // 2, 10), bulk_changelog=False)
+    rounds = itertools.count()
+
+    def setup():
+        return (server.url, str(tmp_path / f"cache_{next(rounds)}.sqlite")), {}
+
+    with server.running():
+        new_issues, transitions, failed = benchmark.pedantic(lambda url, cache_path: asyncio.run(sync(url, cache_path, False)), setup=setup, rounds=1)
+    assert len(new_issues) == sync_issues and all(transition.complete for transition in transitions)
+    assert failed == {"pages": 0, "issues": []}
+    assert server.stats["rate_limited"] > 0
@@ -0,0 +1,79 @@
+# Microbenchmark of the changelog transition scan: the original loop from
+# Jira_GetDurations against TransitionExtractor, on synthetic long-lived issues.
+#   python benchmarks/bench_transitions.py --Issues 2000 --Histories 300
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from TransitionExtractor import TransitionExtractor, STREAMING, orjson
+
+
+def legacy_transitions(response):
+    changelog = json.loads(response)['changelog']['histories']
+    foundDone = False
+    foundStart = False
+    to_Start = to_Done = None
+    for history in changelog:
+        for item in history['items']:
+            if item['field'] == 'status':
+                to_status = item['toString']
+                if to_status == 'Done' or to_status == 'Closed':
+                    to_Done = datetime.strptime(history['created'], '%Y-%m-%dT%H:%M:%S.%f%z')
+                    foundDone = True
+                if to_status == 'In Progress':
+                    to_Start = datetime.strptime(history['created'], '%Y-%m-%dT%H:%M:%S.%f%z')
+                    foundStart = True
+                    if foundDone:
+                        break
+        if foundDone and foundStart:
+            break
+    return to_Start, to_Done
+
+
+# An issue that bounces between statuses for a while, then gets done, followed by
+# a long tail of comment/field edits that still end up in the changelog.
+def synthetic_response(histories):
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    statuses = ["To Do", "In Progress", "In Review", "In Progress"]
+    done_at = histories // 3
+    entries = []
+    for index in range(histories):
+        timestamp = (created + timedelta(hours=index)).strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+        if index < done_at:
+            item = {"field": "status", "fromString": statuses[index % 4 - 1], "toString": statuses[index % 4]}
+        elif index == done_at:
+            item = {"field": "status", "fromString": "In Review", "toString": "Done"}
+        else:
+            item = {"field": "description", "fromString": "old", "toString": "new text " * 20}
+        entries.append({"id": str(index), "created": timestamp, "items": [{"field": "labels", "toString": "x"}, item]})
+    return json.dumps({"key": "BENCH-1", "fields": {"created": created.isoformat()}, "changelog": {"histories": entries}})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--Issues", default="1000")
+    parser.add_argument("--Histories", default="300")
+    parser.add_argument("--Repeat", default="5")
+    args = parser.parse_args()
+
+    responses = [synthetic_response(int(args.Histories)) for _ in range(int(args.Issues))]
+    extractor = TransitionExtractor()
+
+    reference = [legacy_transitions(response) for response in responses]
+    extracted = [extractor.extractFromResponse(response) for response in responses]
+    assert all(r == (e.start, e.done) for r, e in zip(reference, extracted)), "extractor disagrees with the original loop"
+
+    parser_name = "ijson (streaming)" if STREAMING else "orjson" if orjson is not None else "json"
+    print(f"{args.Issues} issues x {args.Histories} histories, extractor parses with {parser_name}")
+    for name, function in [("original loop", legacy_transitions), ("TransitionExtractor", extractor.extractFromResponse)]:
+        best = min(timeit.repeat(lambda: [function(response) for response in responses], number=1, repeat=int(args.Repeat)))
+        print(f"{name:20}: {best * 1000:8.1f} ms ({best / len(responses) * 1e6:6.1f} us per issue)")
+
+
+if __name__ == "__main__":
+    main()
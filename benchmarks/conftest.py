@@ -0,0 +1,51 @@
+import os
+from functools import lru_cache
+from typing import List
+
+import pytest
+
+from benchmarks.SyntheticIssues import SIZES, SyntheticIssues
+
+STORAGE: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmarks")
+
+
+def pytest_addoption(parser) -> None:
+    parser.addoption("--Sizes", default=",".join(str(size) for size in SIZES), help="closed items of the synthetic histories")
+    parser.addoption("--SyncIssues", default="100,1000", help="issues served by the fake Jira for the sync benchmarks")
+    parser.addoption("--Latency", default="0.005", help="seconds the fake Jira waits per response")
+
+
+# Results are always saved, so every run can be compared against the previous ones
+# with --benchmark-compare. The plugin reads its options in a trylast hook.
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config) -> None:
+    if not config.pluginmanager.hasplugin("benchmark"):
+        return
+    if not config.option.benchmark_save and not config.option.benchmark_autosave:
+        from pytest_benchmark.utils import get_tag
+
+        config.option.benchmark_autosave = get_tag()
+    if config.option.benchmark_storage == "file://./.benchmarks":
+        config.option.benchmark_storage = f"file://{STORAGE}"
+
+
+def __sizes(config, option: str) -> List[int]:
+    return [int(size) for size in config.getoption(option).split(",") if size]
+
+
+def pytest_generate_tests(metafunc) -> None:
+    if "size" in metafunc.fixturenames:
+        metafunc.parametrize("size", __sizes(metafunc.config, "--Sizes"))
+    if "sync_issues" in metafunc.fixturenames:
+        metafunc.parametrize("sync_issues", __sizes(metafunc.config, "--SyncIssues"))
+
+
+# Generating a million issues takes a moment, every size is generated once per session
+@lru_cache(maxsize=None)
+def synthetic_issues(count: int) -> SyntheticIssues:
+    return SyntheticIssues(count)
+
+
+@pytest.fixture(scope="session")
+def latency(pytestconfig) -> float:
+    return float(pytestconfig.getoption("--Latency"))
@@ -0,0 +1,78 @@
+# python -m pytest tests
+import numpy as np
+import pytest
+
+import MonteCarloEngine
+
+# Two weeks of daily throughput with idle days, and the same with fractional story points
+HISTORY = [0, 3, 1, 0, 5, 2, 0, 1, 4, 0, 2, 6, 0, 1]
+FRACTIONAL_HISTORY = [0, 1.5, 0.5, 0, 2.5, 1, 0, 0.5, 2, 0, 1, 3, 0, 0.5]
+PERCENTILES = [0.5, 0.7, 0.85, 0.95]
+TRIALS = 200_000
+SEED = 42
+
+
+@pytest.mark.parametrize("history", [HISTORY, FRACTIONAL_HISTORY])
+def test_how_many_numpy_matches_exact(history) -> None:
+    simulated = MonteCarloEngine.run_how_many(history, 20, TRIALS, SEED)
+    exact = MonteCarloEngine.exact_how_many(history, 20, TRIALS)
+
+    assert np.abs(np.subtract(simulated.quantiles(PERCENTILES, descending=True), exact.quantiles(PERCENTILES, descending=True))).max() <= 1
+    assert simulated.probability_at_least(30) == pytest.approx(exact.probability_at_least(30), abs=0.01)
+
+
+@pytest.mark.parametrize("history", [HISTORY, FRACTIONAL_HISTORY])
+def test_when_numpy_matches_exact(history) -> None:
+    simulated = MonteCarloEngine.run_when(history, 30, TRIALS, SEED)
+    exact = MonteCarloEngine.exact_when(history, 30, TRIALS)
+
+    assert np.abs(np.subtract(simulated.quantiles(PERCENTILES), exact.quantiles(PERCENTILES))).max() <= 1
+    assert simulated.probability_at_most(20) == pytest.approx(exact.probability_at_most(20), abs=0.01)
+
+
+@pytest.mark.parametrize("counts_function, parameter", [(MonteCarloEngine.how_many_counts, 20), (MonteCarloEngine.when_counts, 30)])
+def test_same_seed_same_histogram_for_any_workers(counts_function, parameter) -> None:
+    data = np.asarray(HISTORY)
+    # Small shards, so every worker count spreads them over the processes differently
+    histograms = [MonteCarloEngine.run_sharded(counts_function, data, parameter, 50_000, SEED, workers, trials_per_shard=5_000)
+                  for workers in (1, 2, 4)]
+
+    for histogram in histograms[1:]:
+        assert histogram.offset == histograms[0].offset
+        assert np.array_equal(histogram.counts, histograms[0].counts)
+
+
+def test_adaptive_stops_at_its_precision_target() -> None:
+    data = np.asarray(HISTORY)
+    histogram, convergence = MonteCarloEngine.run_adaptive(MonteCarloEngine.how_many_counts, data, 60, PERCENTILES, True, 0.25,
+                                                           seed=SEED, batch_trials=5_000)
+
+    assert convergence.converged and convergence.trials > 5_000 and histogram.total == convergence.trials
+    assert max(convergence.precision.values()) <= 0.25
+    # One batch less, from the same seed, is not precise enough yet
+    _, earlier = MonteCarloEngine.run_adaptive(MonteCarloEngine.how_many_counts, data, 60, PERCENTILES, True, 0.25,
+                                               max_trials=convergence.trials - 5_000, seed=SEED, batch_trials=5_000)
+    assert not earlier.converged and earlier.trials == convergence.trials - 5_000
+    assert max(earlier.precision.values()) > 0.25
+
+
+def test_when_grid_counts_in_the_coarsest_exact_unit() -> None:
+    data, remaining = MonteCarloEngine.when_grid([0, 1.5, 0.5, 2.5], 10)
+    assert data.tolist() == [0, 3, 1, 5] and remaining == 20
+
+
+def test_exact_engine_samples_fine_fractional_throughput() -> None:
+    from datetime import date
+
+    import pandas as pd
+
+    from MonteCarloService import MonteCarloService
+
+    # Throughput in 0.001 story points steps
+    history = np.round(np.random.default_rng(SEED).gamma(1.2, 4.0, 30), 3)
+    assert not MonteCarloEngine.exact_when_supported(history, 100)
+
+    closed_items = pd.DataFrame({"Done Date": pd.date_range("2024-01-01", periods=30).strftime("%Y-%m-%d"), "Items": history})
+    exact = MonteCarloService(30, trials=10_000, engine="exact", seed=SEED).when(100, closed_items, date(2024, 1, 30))
+    numpy = MonteCarloService(30, trials=10_000, engine="numpy", seed=SEED).when(100, closed_items, date(2024, 1, 30))
+    assert exact == numpy
@@ -0,0 +1,38 @@
+# python -m pytest tests
+import pytest
+
+from Histogram import Histogram
+
+# 10 trials: one at 10, none at 11, eight at 12 and one at 13. The 50% to 90%
+# targets all fall on 12, 10% and 90% land exactly on a cumulative count.
+PERCENTILES = [0.1, 0.5, 0.7, 0.85, 0.9, 0.95]
+
+
+@pytest.fixture
+def histogram() -> Histogram:
+    return Histogram([1, 0, 8, 1], offset=10)
+
+
+def test_quantiles_ascending(histogram: Histogram) -> None:
+    # The smallest outcome with P(outcome <= x) >= p
+    assert histogram.quantiles(PERCENTILES) == [10, 12, 12, 12, 12, 13]
+
+
+def test_quantiles_descending(histogram: Histogram) -> None:
+    # The largest outcome with P(outcome >= x) >= p
+    assert histogram.quantiles(PERCENTILES, descending=True) == [13, 12, 12, 12, 12, 10]
+
+
+def test_probability_at_most(histogram: Histogram) -> None:
+    assert [histogram.probability_at_most(value) for value in range(9, 15)] == pytest.approx([0.0, 0.1, 0.1, 0.9, 1.0, 1.0])
+
+
+def test_probability_at_least(histogram: Histogram) -> None:
+    assert [histogram.probability_at_least(value) for value in range(9, 15)] == pytest.approx([1.0, 1.0, 0.9, 0.9, 0.1, 0.0])
+
+
+def test_quantiles_match_probabilities(histogram: Histogram) -> None:
+    for percentile, outcome in zip(PERCENTILES, histogram.quantiles(PERCENTILES)):
+        assert histogram.probability_at_most(outcome) >= percentile
+    for percentile, outcome in zip(PERCENTILES, histogram.quantiles(PERCENTILES, descending=True)):
+        assert histogram.probability_at_least(outcome) >= percentile
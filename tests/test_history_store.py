@@ -0,0 +1,39 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from HistoryStore import HistoryStore
+
+pytest.importorskip("pyarrow")
+
+
+def issue(done_date: str, points: float, key: str = "ABC-1") -> pd.DataFrame:
+    return pd.DataFrame.from_records([{"Issue Key": key, "Done Date": done_date, "Issue Type": "Story", "Story Points": points,
+                                       "Duration": 1.0, "Lead Time": 2.0, "Start": f"{done_date}T09:00:00",
+                                       "Done": f"{done_date}T10:00:00", "Summary": "Issue"}])
+
+
+def test_second_append_wins_within_one_second(tmp_path) -> None:
+    # Many appends within the same second, every time the last one has to win
+    for run in range(20):
+        store = HistoryStore(str(tmp_path / f"store_{run}"))
+        store.append(issue("2024-05-02", 1.0))
+        store.append(issue("2024-05-02", 2.0))
+        assert store.read()["Story Points"].tolist() == [2.0]
+
+
+def test_last_row_of_a_batch_wins(tmp_path) -> None:
+    store = HistoryStore(str(tmp_path / "store"))
+    store.append(pd.concat([issue("2024-05-02", 1.0), issue("2024-05-03", 3.0)]))
+    assert store.read(["Done Date", "Story Points"]).values.tolist() == [["2024-05-03", 3.0]]
+
+
+def test_moved_issue_is_read_from_its_new_month_only(tmp_path) -> None:
+    store = HistoryStore(str(tmp_path / "store"))
+    store.append(issue("2024-04-30", 1.0))
+    store.append(issue("2024-05-02", 2.0))
+
+    assert store.read(start_date=date(2024, 4, 1), end_date=date(2024, 4, 30)).empty
+    assert store.read(["Done Date", "Story Points"], date(2024, 4, 1), date(2024, 5, 31)).values.tolist() == [["2024-05-02", 2.0]]
+    assert store.keys() == {"ABC-1"}